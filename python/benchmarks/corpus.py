@@ -0,0 +1,88 @@
+import os
+import csv
+import random
+import argparse
+
+WORDS = (
+    "model retrieval document vector index query latency token context embedding chunk "
+    "storage session answer source page table report quarter revenue forecast policy "
+    "customer product release schedule budget analysis summary result method data"
+).split()
+
+
+def _sentence(rng, length=12):
+    words = [rng.choice(WORDS) for _ in range(length)]
+    return " ".join(words).capitalize() + "."
+
+
+def _paragraph(rng, sentences=5):
+    return " ".join(_sentence(rng) for _ in range(sentences))
+
+
+def make_pdf(path, pages, rng):
+    import fitz
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(50, 50, 550, 800), "\n\n".join(_paragraph(rng) for _ in range(6)), fontsize=10)
+    doc.save(path)
+    doc.close()
+
+
+def make_docx(path, sections, rng):
+    from docx import Document
+    doc = Document()
+    for index in range(sections):
+        doc.add_heading(f"Section {index + 1}", level=1)
+        for _ in range(3):
+            doc.add_paragraph(_paragraph(rng))
+        table = doc.add_table(rows=4, cols=3)
+        for row in table.rows:
+            for cell in row.cells:
+                cell.text = rng.choice(WORDS)
+    doc.save(path)
+
+
+def make_xlsx(path, rows, rng, sheets=2):
+    import openpyxl
+    wb = openpyxl.Workbook(write_only=True)
+    for sheet_index in range(sheets):
+        sheet = wb.create_sheet(f"Sheet{sheet_index + 1}")
+        sheet.append(["id", "name", "category", "amount", "notes"])
+        for row in range(rows):
+            sheet.append([row, rng.choice(WORDS), rng.choice(WORDS), round(rng.uniform(0, 1000), 2), _sentence(rng, 6)])
+    wb.save(path)
+
+
+def make_csv(path, rows, rng):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "name", "category", "amount", "notes"])
+        for row in range(rows):
+            writer.writerow([row, rng.choice(WORDS), rng.choice(WORDS), round(rng.uniform(0, 1000), 2), _sentence(rng, 6)])
+
+
+def generate_corpus(output_dir, scale=1, seed=1234):
+    rng = random.Random(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    files = {
+        "pdf": os.path.join(output_dir, "bench_report.pdf"),
+        "docx": os.path.join(output_dir, "bench_notes.docx"),
+        "xlsx": os.path.join(output_dir, "bench_ledger.xlsx"),
+        "csv": os.path.join(output_dir, "bench_export.csv"),
+    }
+    make_pdf(files["pdf"], 10 * scale, rng)
+    make_docx(files["docx"], 10 * scale, rng)
+    make_xlsx(files["xlsx"], 500 * scale, rng)
+    make_csv(files["csv"], 2000 * scale, rng)
+    return files
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a deterministic benchmark corpus.")
+    parser.add_argument("output_dir")
+    parser.add_argument("--scale", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+    for kind, path in generate_corpus(args.output_dir, args.scale, args.seed).items():
+        print(f"{kind}: {path} ({os.path.getsize(path)} bytes)")
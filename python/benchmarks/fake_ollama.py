@@ -0,0 +1,171 @@
+import json
+import time
+import hashlib
+import argparse
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+
+class FakeOllamaConfig:
+    def __init__(self, embedding_dim=384, embed_latency=0.0, embed_latency_per_item=0.0,
+                 first_token_latency=0.05, token_rate=50.0, response_tokens=60):
+        self.embedding_dim = embedding_dim
+        self.embed_latency = embed_latency
+        self.embed_latency_per_item = embed_latency_per_item
+        self.first_token_latency = first_token_latency
+        self.token_rate = token_rate
+        self.response_tokens = response_tokens
+
+
+def fake_embedding(text, dim):
+    # Deterministic, normalised vectors so retrieval results are stable between runs.
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dim)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = FakeOllamaConfig()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _start_stream(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _write_chunk(self, payload):
+        data = (json.dumps(payload) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _end_stream(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json({"models": [{"name": "llama3.2:1b"}, {"name": "all-minilm"}]})
+        elif self.path == "/api/version":
+            self._send_json({"version": "0.0.0-fake"})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        request = self._read_json()
+        if self.path == "/api/embed":
+            inputs = request.get("input", [])
+            if isinstance(inputs, str):
+                inputs = [inputs]
+            time.sleep(self.config.embed_latency + self.config.embed_latency_per_item * len(inputs))
+            self._send_json({
+                "model": request.get("model"),
+                "embeddings": [fake_embedding(text, self.config.embedding_dim) for text in inputs]
+            })
+        elif self.path == "/api/embeddings":
+            time.sleep(self.config.embed_latency + self.config.embed_latency_per_item)
+            self._send_json({"embedding": fake_embedding(request.get("prompt", ""), self.config.embedding_dim)})
+        elif self.path in ("/api/generate", "/api/chat"):
+            self._generate(request, chat=self.path == "/api/chat")
+        elif self.path == "/api/show":
+            self._send_json({"modelfile": "", "parameters": "", "template": "", "details": {}})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def _generate(self, request, chat):
+        model = request.get("model")
+        options = request.get("options") or {}
+        num_tokens = min(self.config.response_tokens, int(options.get("num_predict") or self.config.response_tokens))
+        tokens = [f"token{i} " for i in range(num_tokens)]
+
+        time.sleep(self.config.first_token_latency)
+        if not request.get("stream", True):
+            text = "".join(tokens)
+            time.sleep(num_tokens / self.config.token_rate)
+            payload = {"model": model, "created_at": _now(), "done": True, "done_reason": "stop"}
+            if chat:
+                payload["message"] = {"role": "assistant", "content": text}
+            else:
+                payload["response"] = text
+            self._send_json(payload)
+            return
+
+        try:
+            self._start_stream()
+            for token in tokens:
+                payload = {"model": model, "created_at": _now(), "done": False}
+                if chat:
+                    payload["message"] = {"role": "assistant", "content": token}
+                else:
+                    payload["response"] = token
+                self._write_chunk(payload)
+                time.sleep(1.0 / self.config.token_rate)
+
+            final = {"model": model, "created_at": _now(), "done": True, "done_reason": "stop",
+                     "eval_count": num_tokens}
+            if chat:
+                final["message"] = {"role": "assistant", "content": ""}
+            else:
+                final["response"] = ""
+            self._write_chunk(final)
+            self._end_stream()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client cancelled the generation.
+            self.close_connection = True
+
+
+def start_fake_ollama(config, host="127.0.0.1", port=0):
+    handler = type("ConfiguredFakeOllamaHandler", (FakeOllamaHandler,), {"config": config})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the Ollama embed and generate endpoints.")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--embedding-dim", type=int, default=384)
+    parser.add_argument("--embed-latency", type=float, default=0.0)
+    parser.add_argument("--embed-latency-per-item", type=float, default=0.0)
+    parser.add_argument("--first-token-latency", type=float, default=0.05)
+    parser.add_argument("--token-rate", type=float, default=50.0)
+    parser.add_argument("--response-tokens", type=int, default=60)
+    args = parser.parse_args()
+
+    server = start_fake_ollama(FakeOllamaConfig(
+        embedding_dim=args.embedding_dim,
+        embed_latency=args.embed_latency,
+        embed_latency_per_item=args.embed_latency_per_item,
+        first_token_latency=args.first_token_latency,
+        token_rate=args.token_rate,
+        response_tokens=args.response_tokens
+    ), port=args.port)
+    print(f"Fake Ollama listening on http://127.0.0.1:{server.server_address[1]}", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
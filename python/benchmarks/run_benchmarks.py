@@ -0,0 +1,297 @@
+import os
+import sys
+import json
+import time
+import queue
+import shutil
+import argparse
+import tempfile
+import platform
+import threading
+import subprocess
+from pathlib import Path
+
+from corpus import generate_corpus
+from fake_ollama import FakeOllamaConfig, start_fake_ollama
+
+SCRIPTS_DIR = Path(__file__).resolve().parent.parent / "scripts"
+
+# Metrics where a larger value is better; everything else is a duration or a size.
+HIGHER_IS_BETTER = ("throughput", "tokens_per_s")
+
+QUESTIONS = [
+    "What does the report say about revenue?",
+    "Summarise the budget analysis.",
+    "Which categories appear in the ledger?",
+    "What is the release schedule?",
+]
+
+
+class BackendProcess:
+    def __init__(self, data_dir, ollama_port):
+        env = os.environ.copy()
+        env["ELECTRON_APP_DATA_DIR"] = str(data_dir)
+        env["OLLAMA_HOST"] = f"127.0.0.1:{ollama_port}"
+        env["PYTHONUNBUFFERED"] = "1"
+        # main.py only creates storage/ inside the data directory, not the
+        # directory itself.
+        os.makedirs(str(data_dir), exist_ok=True)
+        self.log_path = Path(data_dir) / "backend.log"
+        self._log = open(self.log_path, "w")
+        self.process = subprocess.Popen(
+            [sys.executable, str(SCRIPTS_DIR / "main.py")],
+            cwd=str(SCRIPTS_DIR),
+            env=env,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=self._log,
+            text=True,
+            bufsize=1
+        )
+        self.responses = {}
+        self._responses_lock = threading.Lock()
+        self._next_id = 0
+        self._reader = threading.Thread(target=self._read_stdout, daemon=True)
+        self._reader.start()
+
+    def _queue_for(self, request_id):
+        with self._responses_lock:
+            return self.responses.setdefault(request_id, queue.Queue())
+
+    def _read_stdout(self):
+        for line in self.process.stdout:
+            line = line.strip()
+            if not line.startswith("{"):
+                continue
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+            request_id = message.get("requestId")
+            if request_id is not None:
+                self._queue_for(request_id).put((time.perf_counter(), message))
+
+    def send(self, command, data=None):
+        self._next_id += 1
+        request_id = f"bench-{self._next_id}"
+        self._queue_for(request_id)
+        self.process.stdin.write(json.dumps({"requestId": request_id, "command": command, "data": data or {}}) + "\n")
+        self.process.stdin.flush()
+        return request_id
+
+    def messages(self, request_id, timeout=600):
+        responses = self._queue_for(request_id)
+        while True:
+            deadline = time.monotonic() + timeout
+            while True:
+                try:
+                    received_at, message = responses.get(timeout=1)
+                    break
+                except queue.Empty:
+                    # Fail as soon as the backend dies instead of waiting out the timeout.
+                    exit_code = self.process.poll()
+                    if exit_code is None and time.monotonic() < deadline:
+                        continue
+                    state = "is still running" if exit_code is None else f"exited with code {exit_code}"
+                    raise RuntimeError(f"No response to {request_id}; the backend {state}. "
+                                       f"Last lines of {self.log_path}:\n{self.log_tail()}")
+            yield received_at, message
+            if message.get("done") or "error" in message:
+                return
+
+    def call(self, command, data=None, timeout=600):
+        started = time.perf_counter()
+        request_id = self.send(command, data)
+        last = None
+        for _, message in self.messages(request_id, timeout):
+            last = message
+        if "error" in last:
+            raise RuntimeError(f"{command} failed: {last['error']}")
+        return time.perf_counter() - started, last
+
+    def peak_rss_bytes(self):
+        status_path = f"/proc/{self.process.pid}/status"
+        if os.path.exists(status_path):
+            with open(status_path) as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        return int(line.split()[1]) * 1024
+        return None
+
+    def log_tail(self, lines=30):
+        self._log.flush()
+        with open(self.log_path, errors="replace") as f:
+            return "".join(f.readlines()[-lines:])
+
+    def shutdown(self):
+        if self.process.poll() is None:
+            try:
+                self.call("shutdown", timeout=30)
+            except Exception:
+                pass
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=30)
+        except Exception:
+            self.process.kill()
+        self._log.close()
+
+
+def run_suite(args):
+    config = FakeOllamaConfig(
+        embed_latency=args.embed_latency,
+        embed_latency_per_item=args.embed_latency_per_item,
+        first_token_latency=args.first_token_latency,
+        token_rate=args.token_rate,
+        response_tokens=args.response_tokens
+    )
+    server = start_fake_ollama(config)
+    work_dir = Path(tempfile.mkdtemp(prefix="herma_bench_"))
+    results = {}
+
+    try:
+        corpus = generate_corpus(str(work_dir / "corpus"), scale=args.scale)
+
+        started = time.perf_counter()
+        backend = BackendProcess(work_dir / "app_data", server.server_address[1])
+        try:
+            backend.call("ping", timeout=120)
+            results["startup_s"] = time.perf_counter() - started
+
+            total_bytes = 0
+            total_upload = 0.0
+            for kind, source_path in corpus.items():
+                # upload moves the file into storage, so hand it a copy.
+                upload_path = work_dir / f"upload_{os.path.basename(source_path)}"
+                shutil.copy(source_path, upload_path)
+                size = os.path.getsize(upload_path)
+                elapsed, _ = backend.call("upload", {
+                    "filename": os.path.basename(source_path),
+                    "filepath": str(upload_path)
+                })
+                results[f"upload_{kind}_s"] = elapsed
+                total_bytes += size
+                total_upload += elapsed
+            results["upload_total_s"] = total_upload
+            results["ingest_throughput_mb_s"] = (total_bytes / (1024 * 1024)) / total_upload if total_upload else 0.0
+
+            backend.call("select", {"filenames": [os.path.basename(path) for path in corpus.values()]})
+
+            first_token_times = []
+            chat_times = []
+            chunk_counts = []
+            for question in QUESTIONS[:args.questions]:
+                started = time.perf_counter()
+                request_id = backend.send("chat", {"message": question})
+                first_chunk_at = None
+                chunks = 0
+                for received_at, message in backend.messages(request_id):
+                    if "error" in message:
+                        raise RuntimeError(f"chat failed: {message['error']}")
+                    if "chunk" in message:
+                        chunks += 1
+                        if first_chunk_at is None:
+                            first_chunk_at = received_at
+                finished_at = time.perf_counter()
+                first_token_times.append((first_chunk_at or finished_at) - started)
+                chat_times.append(finished_at - started)
+                chunk_counts.append(chunks)
+                backend.call("new_session")
+
+            results["chat_first_token_s"] = sorted(first_token_times)[len(first_token_times) // 2]
+            results["chat_total_s"] = sorted(chat_times)[len(chat_times) // 2]
+            generation_time = sum(chat_times) - sum(first_token_times)
+            results["chat_tokens_per_s"] = sum(chunk_counts) / generation_time if generation_time > 0 else 0.0
+
+            # Per-stage timings recorded by the backend's own spans.
+            _, metrics_response = backend.call("metrics")
+            for stage, histogram in metrics_response.get("metrics", {}).get("histograms", {}).items():
+                if stage.endswith("tokens_per_s"):
+                    results[f"stage_{stage}_p50"] = histogram["p50"]
+                else:
+                    results[f"stage_{stage}_p50_s"] = histogram["p50"]
+            # Parsing runs in worker processes whose memory is not part of the
+            # backend's own high-water mark; the pool samples it while they work.
+            worker_rss = metrics_response.get("metrics", {}).get("gauges", {}).get("ingest.worker_peak_rss_bytes")
+            if isinstance(worker_rss, (int, float)) and worker_rss:
+                results["peak_worker_rss_mb"] = worker_rss / (1024 * 1024)
+
+            peak_rss = backend.peak_rss_bytes()
+            if peak_rss is not None:
+                results["peak_rss_mb"] = peak_rss / (1024 * 1024)
+        finally:
+            backend.shutdown()
+
+        if "peak_rss_mb" not in results and platform.system() != "Windows":
+            import resource
+            max_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+            # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+            results["peak_rss_mb"] = max_rss / (1024 * 1024 if platform.system() == "Darwin" else 1024)
+    finally:
+        server.shutdown()
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return results
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    regressions = []
+    for name, value in results.items():
+        if name not in baseline or not isinstance(value, (int, float)):
+            continue
+        reference = baseline[name]
+        if reference == 0:
+            continue
+        if any(marker in name for marker in HIGHER_IS_BETTER):
+            if value < reference * (1 - tolerance):
+                regressions.append((name, reference, value))
+        elif value > reference * (1 + tolerance):
+            regressions.append((name, reference, value))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Drive the Python backend over its stdin/stdout protocol against a fake Ollama server."
+    )
+    parser.add_argument("--scale", type=int, default=1, help="Corpus size multiplier")
+    parser.add_argument("--questions", type=int, default=len(QUESTIONS))
+    parser.add_argument("--embed-latency", type=float, default=0.005)
+    parser.add_argument("--embed-latency-per-item", type=float, default=0.001)
+    parser.add_argument("--first-token-latency", type=float, default=0.05)
+    parser.add_argument("--token-rate", type=float, default=200.0)
+    parser.add_argument("--response-tokens", type=int, default=60)
+    parser.add_argument("--baseline", help="Compare against a saved baseline JSON file")
+    parser.add_argument("--save-baseline", help="Write the results to this baseline JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative regression")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary working directory")
+    args = parser.parse_args()
+
+    results = run_suite(args)
+
+    for name, value in results.items():
+        print(f"{name:28s} {value:10.3f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved baseline to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        for name, reference, value in regressions:
+            print(f"REGRESSION {name}: baseline {reference:.3f}, now {value:.3f}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import os
+import pickle
+import threading
+import time
+import numpy as np
+from get_embedding_function import get_embedding_id
+
+
+class AnswerCache:
+    def __init__(self, filename, similarity_threshold=0.95, max_entries=500):
+        self.filename = filename
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self.entries = self._load()
+
+    @staticmethod
+    def is_enabled():
+        return os.environ.get('HERMA_ANSWER_CACHE', '0').lower() in ('1', 'true', 'yes')
+
+    @staticmethod
+    def documents_key(currently_used_data):
+        # The vector database path carries the upload timestamp, so re-uploading a
+        # document under the same name produces a different key. Watched folders
+        # keep their path and bump a revision whenever they are re-indexed. Query
+        # embeddings are only comparable within one embedding backend.
+        return (get_embedding_id(),) + tuple(sorted(f"{data.vector_database_path}@{getattr(data, 'revision', 0)}"
+                                                    for data in currently_used_data))
+
+    def _load(self):
+        try:
+            if not os.path.exists(self.filename) or os.path.getsize(self.filename) == 0:
+                return []
+            with open(self.filename, 'rb') as file:
+                return pickle.load(file)
+        except Exception as e:
+            print(f"Failed to load AnswerCache: {str(e)}")
+            return []
+
+    def save(self):
+        try:
+            os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+            temp_file = f"{self.filename}.tmp"
+            with open(temp_file, 'wb') as file:
+                pickle.dump(self.entries, file)
+            os.replace(temp_file, self.filename)
+        except Exception as e:
+            print(f"Failed to save AnswerCache: {str(e)}")
+
+    def lookup(self, query_embedding, documents_key):
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query_norm = np.linalg.norm(query)
+        if query_norm == 0:
+            return None
+
+        with self._lock:
+            best_entry = None
+            best_similarity = self.similarity_threshold
+            for entry in self.entries:
+                if entry["documents"] != documents_key:
+                    continue
+                cached = entry["embedding"]
+                similarity = float(np.dot(query, cached) / (query_norm * entry["norm"]))
+                if similarity >= best_similarity:
+                    best_entry = entry
+                    best_similarity = similarity
+
+            if best_entry is not None:
+                best_entry["last_used"] = time.time()
+                best_entry["hits"] += 1
+            return best_entry
+
+    def store(self, query_text, query_embedding, documents_key, answer, sources):
+        embedding = np.asarray(query_embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(embedding))
+        if norm == 0:
+            return
+
+        with self._lock:
+            self.entries.append({
+                "query": query_text,
+                "embedding": embedding,
+                "norm": norm,
+                "documents": documents_key,
+                "answer": answer,
+                "sources": sources,
+                "last_used": time.time(),
+                "hits": 0
+            })
+            if len(self.entries) > self.max_entries:
+                self.entries.sort(key=lambda entry: entry["last_used"])
+                del self.entries[:len(self.entries) - self.max_entries]
+            self.save()
+
+    def forget_documents(self, vector_database_path):
+        with self._lock:
+            prefix = f"{vector_database_path}@"
+            remaining = [entry for entry in self.entries
+                         if not any(key.startswith(prefix) for key in entry["documents"])]
+            if len(remaining) != len(self.entries):
+                self.entries = remaining
+                self.save()
@@ -0,0 +1,203 @@
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from uploaded_data import Uploaded_data, EMBEDDING_BATCH_SIZE
+from vector_store import VectorStoreWriter
+from storage_manager import get_storage_manager
+from get_embedding_function import get_embedding_function
+from tracing import span, increment
+
+_FILE_DONE = object()
+
+
+class _BatchFile:
+    def __init__(self, name, data_path, chunk_size):
+        self.data = Uploaded_data(name, data_path, True, chunk_size, ingest=False)
+        self.writer = None
+        self.head_chunks = []
+        self.tail_chunks = deque(maxlen=3)
+        self.total_chunks = 0
+        self.pending_chunks = 0
+        self.parsed = False
+        self.failed = False
+
+    def add_chunk(self, chunk):
+        if len(self.head_chunks) < 6:
+            self.head_chunks.append(chunk)
+        self.tail_chunks.append(chunk)
+        self.total_chunks += 1
+        self.pending_chunks += 1
+
+    def sample_chunks(self):
+        if self.total_chunks < 6:
+            return self.head_chunks
+        return self.head_chunks[:3] + list(self.tail_chunks)
+
+
+class BatchUpload:
+    # Files are parsed in parallel, but their chunks share one embedding queue so
+    # every embed call is a full batch no matter how small the individual files
+    # are. Each file still gets its own collection and summary, and is reported
+    # as soon as its last chunk is written.
+    def __init__(self, files, chunk_size, on_result, parse_threads=None):
+        self.files = files
+        self.chunk_size = chunk_size
+        self.on_result = on_result
+        if parse_threads is None:
+            parse_threads = int(os.environ.get('HERMA_UPLOAD_PARSE_THREADS', '4'))
+        self.parse_threads = max(1, parse_threads)
+        self.embedding_function = get_embedding_function()
+        self._chunks = queue.Queue(maxsize=EMBEDDING_BATCH_SIZE * 4)
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self.results = []
+
+    def _put(self, item):
+        while not self._stopped.is_set():
+            try:
+                self._chunks.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _parse(self, batch_file):
+        try:
+            for chunk in batch_file.data.extract_chunks(batch_file.data.data_path):
+                if not self._put((batch_file, chunk)):
+                    return
+            self._put((batch_file, _FILE_DONE))
+        except Exception as e:
+            self._put((batch_file, e))
+
+    def _embed(self, batch):
+        batch = [(batch_file, chunk) for batch_file, chunk in batch if not batch_file.failed]
+        if not batch:
+            return
+        try:
+            with span("ingest.embed_batch"):
+                embeddings = self.embedding_function.embed_documents([chunk.page_content for _, chunk in batch])
+        except Exception as e:
+            for batch_file in {batch_file for batch_file, _ in batch}:
+                self._fail(batch_file, e)
+            return
+
+        by_file = {}
+        for (batch_file, chunk), embedding in zip(batch, embeddings):
+            chunks, file_embeddings = by_file.setdefault(batch_file, ([], []))
+            chunks.append(chunk)
+            file_embeddings.append(embedding)
+
+        for batch_file, (chunks, file_embeddings) in by_file.items():
+            if batch_file.failed:
+                continue
+            try:
+                if batch_file.writer is None:
+                    batch_file.writer = VectorStoreWriter(batch_file.data.vector_database_path)
+                batch_file.writer.add_embedded(chunks, file_embeddings)
+                batch_file.pending_chunks -= len(chunks)
+            except Exception as e:
+                self._fail(batch_file, e)
+        increment("ingest.chunks", len(batch))
+
+    def _fail(self, batch_file, error):
+        if batch_file.failed:
+            return
+        batch_file.failed = True
+        print(f"Error indexing {batch_file.data.name}: {error}")
+        get_storage_manager().discard_partial(batch_file.data.vector_database_path)
+        self._report(batch_file.data.name, None, str(error))
+
+    def _report(self, name, data, error):
+        with self._lock:
+            self.results.append({"name": name, "success": error is None, "error": error})
+        self.on_result(name, data, error)
+
+    def _finish(self, batch_file, summarizer):
+        try:
+            if batch_file.writer is None:
+                batch_file.writer = VectorStoreWriter(batch_file.data.vector_database_path)
+            batch_file.writer.close()
+            data = batch_file.data
+            get_storage_manager().register(data.vector_database_path, data.name, data.data_path)
+        except Exception as e:
+            self._fail(batch_file, e)
+            return
+        summarizer.submit(self._summarize, batch_file)
+
+    def _summarize(self, batch_file):
+        data = batch_file.data
+        try:
+            with span("ingest.summary"):
+                data.data_summary = data.generate_summary(batch_file.sample_chunks())
+        except Exception as e:
+            print(f"Error summarizing {data.name}: {e}")
+            data.data_summary = "No summary available."
+        self._report(data.name, data, None)
+
+    def run(self):
+        batch_files = []
+        for name, data_path in self.files:
+            try:
+                batch_files.append(_BatchFile(name, data_path, self.chunk_size))
+            except Exception as e:
+                self._report(name, None, str(e))
+
+        # Each file only registers its store once it is fully written; until then
+        # it is held in use so quota eviction and the orphan sweep skip it.
+        storage = get_storage_manager()
+        for batch_file in batch_files:
+            storage.acquire(batch_file.data.vector_database_path)
+        try:
+            return self._run(batch_files)
+        finally:
+            for batch_file in batch_files:
+                storage.release(batch_file.data.vector_database_path)
+
+    def _run(self, batch_files):
+        remaining = len(batch_files)
+        finished = []
+        batch = []
+        # The summarizer is a single thread: the local LLM serves one request at
+        # a time anyway, and embedding keeps going while it runs.
+        with ThreadPoolExecutor(max_workers=self.parse_threads) as parsers, \
+                ThreadPoolExecutor(max_workers=1) as summarizer:
+            try:
+                for batch_file in batch_files:
+                    parsers.submit(self._parse, batch_file)
+
+                while remaining or batch:
+                    try:
+                        batch_file, item = self._chunks.get(timeout=0.5) if remaining else (None, None)
+                    except queue.Empty:
+                        # Parsers are slow; don't hold back files that are complete.
+                        if finished and batch:
+                            self._embed(batch)
+                            batch = []
+                        batch_file = None
+
+                    if batch_file is not None:
+                        if item is _FILE_DONE:
+                            remaining -= 1
+                            batch_file.parsed = True
+                            finished.append(batch_file)
+                        elif isinstance(item, Exception):
+                            remaining -= 1
+                            self._fail(batch_file, item)
+                        elif not batch_file.failed:
+                            batch_file.add_chunk(item)
+                            batch.append((batch_file, item))
+
+                    if len(batch) >= EMBEDDING_BATCH_SIZE or (not remaining and batch):
+                        self._embed(batch)
+                        batch = []
+
+                    for done_file in [f for f in finished if f.pending_chunks == 0 or f.failed]:
+                        finished.remove(done_file)
+                        if not done_file.failed:
+                            self._finish(done_file, summarizer)
+            finally:
+                self._stopped.set()
+        return self.results
@@ -0,0 +1,127 @@
+import re
+
+_TOKEN_PATTERN = re.compile(r"\w{1,6}|[^\w\s]")
+# Per-piece cost of the "From document '...':" header and the separator.
+PIECE_OVERHEAD_TOKENS = 12
+
+
+def estimate_tokens(text):
+    # Close enough to Llama's BPE for budgeting: words cost one token per six
+    # characters and punctuation one token each.
+    return len(_TOKEN_PATTERN.findall(text))
+
+
+def chunk_tokens(doc):
+    tokens = doc.metadata.get("tokens")
+    if tokens is None:
+        # Collections indexed before token counts were stored.
+        tokens = estimate_tokens(doc.page_content)
+    return tokens
+
+
+def candidates_per_document(budget_tokens, chunk_size, document_count):
+    # Fetch enough candidates that the budget could be filled from any one
+    # document, assuming chunks of about a quarter token per character.
+    expected_chunks = budget_tokens / max(chunk_size / 4 + PIECE_OVERHEAD_TOKENS, 1)
+    return int(min(20, max(3, expected_chunks / max(document_count, 1) + 2)))
+
+
+def similarity_from_distance(distance):
+    # Both stores return squared L2 distance between unit vectors.
+    return 1.0 - distance / 2.0
+
+
+def _split_id(chunk_id):
+    source = chunk_id.split("/")[-1]
+    file_parts = source.split(" Page: ")
+    filename = file_parts[0]
+    page = "-"
+    index = None
+    if len(file_parts) > 1 and ":" in file_parts[1]:
+        page, _, index = file_parts[1].rpartition(":")
+    return filename, page, int(index) if index and index.isdigit() else None
+
+
+def _merge_overlap(first, second, max_overlap=120):
+    # The splitter repeats up to chunk_overlap characters at the start of the
+    # next chunk; drop them instead of sending them twice.
+    for size in range(min(max_overlap, len(first), len(second)), 9, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return first + "\n" + second
+
+
+class PackedPiece:
+    def __init__(self, document_name, filename, page, index, text, similarity):
+        self.document_name = document_name
+        self.filename = filename
+        self.page = page
+        self.first_index = index
+        self.last_index = index
+        self.text = text
+        self.similarity = similarity
+
+    @property
+    def section(self):
+        if self.first_index is None:
+            return "-"
+        if self.first_index == self.last_index:
+            return str(self.first_index)
+        return f"{self.first_index}-{self.last_index}"
+
+
+def pack_context(results, budget_tokens, min_similarity=0.2, similarity_margin=0.25):
+    # results are (doc, distance) pairs from any number of documents. Chunks are
+    # taken in rank order until the budget is spent; anything below
+    # min_similarity or more than similarity_margin behind the best hit is left out.
+    ranked = sorted(results, key=lambda result: result[1])
+    if not ranked:
+        return []
+
+    best_similarity = similarity_from_distance(ranked[0][1])
+    cutoff = max(min_similarity, best_similarity - similarity_margin)
+
+    selected = []
+    seen_ids = set()
+    used_tokens = 0
+    for doc, distance in ranked:
+        similarity = similarity_from_distance(distance)
+        if similarity < cutoff:
+            break
+        chunk_id = doc.metadata.get("id", "")
+        key = (doc.metadata.get("document_name"), chunk_id)
+        if chunk_id and key in seen_ids:
+            continue
+        cost = chunk_tokens(doc) + PIECE_OVERHEAD_TOKENS
+        if used_tokens + cost > budget_tokens:
+            # A smaller chunk further down may still fit.
+            continue
+        seen_ids.add(key)
+        used_tokens += cost
+        selected.append((doc, similarity))
+
+    # Merge neighbouring chunks of the same page so the overlap is sent once.
+    pieces = []
+    by_page = {}
+    for doc, similarity in selected:
+        document_name = doc.metadata.get("document_name", "Unknown")
+        filename, page, index = _split_id(doc.metadata.get("id", ""))
+        piece = PackedPiece(document_name, filename, page, index, doc.page_content, similarity)
+        by_page.setdefault((document_name, filename, page), []).append(piece)
+
+    for page_pieces in by_page.values():
+        page_pieces.sort(key=lambda piece: (piece.first_index is None, piece.first_index or 0))
+        merged = [page_pieces[0]]
+        for piece in page_pieces[1:]:
+            previous = merged[-1]
+            if piece.first_index is not None and previous.last_index is not None \
+                    and piece.first_index == previous.last_index + 1:
+                previous.text = _merge_overlap(previous.text, piece.text)
+                previous.last_index = piece.first_index
+                previous.similarity = max(previous.similarity, piece.similarity)
+            else:
+                merged.append(piece)
+        pieces.extend(merged)
+
+    pieces.sort(key=lambda piece: piece.similarity, reverse=True)
+    return pieces
@@ -0,0 +1,106 @@
+import os
+import re
+import hashlib
+import threading
+import numpy as np
+from pathlib import Path
+from langchain_core.embeddings import Embeddings
+
+
+class HashingEmbeddings(Embeddings):
+    def __init__(self, dimensions=384):
+        self.dimensions = dimensions
+        self.embedding_id = f"hash:{dimensions}"
+
+    def _embed(self, text):
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        tokens = re.findall(r"\w+", text.lower())
+        features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        for feature in features:
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            sign = 1.0 if value & 1 else -1.0
+            vector[(value >> 1) % self.dimensions] += sign
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector.tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+class LocalMiniLMEmbeddings(Embeddings):
+    def __init__(self, model_dir, batch_size=32, max_length=256, num_threads=None):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        model_dir = Path(model_dir)
+        model_path = model_dir / "model.onnx"
+        tokenizer_path = model_dir / "tokenizer.json"
+        if not model_path.exists() or not tokenizer_path.exists():
+            raise FileNotFoundError(f"Expected model.onnx and tokenizer.json in {model_dir}")
+
+        self.embedding_id = f"local:{model_dir.parent.name if model_dir.name == 'onnx' else model_dir.name}"
+        self.batch_size = batch_size
+
+        self.tokenizer = Tokenizer.from_file(str(tokenizer_path))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = num_threads or max(1, (os.cpu_count() or 2) // 2)
+        self.session = onnxruntime.InferenceSession(str(model_path), sess_options=options,
+                                                    providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        # onnxruntime sessions are thread-safe, but the tokenizer's padding state is not.
+        self._tokenizer_lock = threading.Lock()
+
+    def _embed_batch(self, texts):
+        with self._tokenizer_lock:
+            encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([encoding.ids for encoding in encodings], dtype=np.int64)
+        attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+
+        inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            inputs["token_type_ids"] = np.zeros_like(input_ids)
+
+        last_hidden_state = self.session.run(None, inputs)[0]
+
+        # Mean pooling over real tokens, then L2 normalisation, as sentence-transformers does.
+        mask = attention_mask[:, :, None].astype(np.float32)
+        summed = (last_hidden_state * mask).sum(axis=1)
+        counts = np.clip(mask.sum(axis=1), 1e-9, None)
+        embeddings = summed / counts
+        norms = np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return (embeddings / norms).astype(np.float32)
+
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+        batches = [self._embed_batch(texts[start:start + self.batch_size])
+                   for start in range(0, len(texts), self.batch_size)]
+        return np.concatenate(batches).tolist()
+
+    def embed_query(self, text):
+        return self._embed_batch([text])[0].tolist()
+
+
+def find_local_model_dir(storage_dir):
+    configured = os.environ.get('HERMA_EMBEDDING_MODEL_DIR')
+    if configured:
+        return Path(configured)
+
+    candidates = [
+        Path(storage_dir) / "models" / "all-MiniLM-L6-v2",
+        # Chroma's default embedding function caches the same model here.
+        Path.home() / ".cache" / "chroma" / "onnx_models" / "all-MiniLM-L6-v2" / "onnx",
+    ]
+    for candidate in candidates:
+        if (candidate / "model.onnx").exists():
+            return candidate
+    return candidates[0]
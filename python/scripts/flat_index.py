@@ -0,0 +1,113 @@
+import os
+import json
+import struct
+import numpy as np
+from langchain_core.documents import Document
+
+FLAT_INDEX_SUFFIX = ".hflat"
+MAGIC = b"HFLAT001"
+ALIGNMENT = 64
+
+
+class FlatIndex:
+    # Layout: magic, header length, JSON header (ids, texts, metadata), padding,
+    # then the vector matrix and, for int8, one float32 scale per row. The matrix
+    # is memory-mapped so opening an index does not copy the vectors.
+    def __init__(self, path, header, matrix, scales):
+        self.path = path
+        self.embedding_id = header["embedding_id"]
+        self.ids = header["ids"]
+        self.texts = header["texts"]
+        self.metadatas = header["metadatas"]
+        self.matrix = matrix
+        self.scales = scales
+
+    @staticmethod
+    def write(path, embedding_id, ids, texts, metadatas, embeddings, dtype="int8"):
+        # Files with no extractable text still get an (empty) index.
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if not len(ids):
+            vectors = np.zeros((0, 0), dtype=np.float32)
+        elif vectors.ndim != 2:
+            vectors = vectors.reshape(len(ids), -1)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.clip(norms, 1e-12, None)
+
+        scales = None
+        if dtype == "int8":
+            scales = np.clip(np.abs(vectors).max(axis=1, initial=0.0), 1e-12, None) / 127.0
+            matrix = np.round(vectors / scales[:, None]).astype(np.int8)
+            scales = scales.astype(np.float32)
+        else:
+            matrix = vectors.astype(np.float16)
+
+        header = {
+            "embedding_id": embedding_id,
+            "dtype": dtype,
+            "count": len(ids),
+            "dim": int(matrix.shape[1]) if len(ids) else 0,
+            "ids": ids,
+            "texts": texts,
+            "metadatas": metadatas
+        }
+        header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+        matrix_offset = len(MAGIC) + 8 + len(header_bytes)
+        padding = (-matrix_offset) % ALIGNMENT
+
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(MAGIC)
+            f.write(struct.pack("<Q", len(header_bytes)))
+            f.write(header_bytes)
+            f.write(b"\0" * padding)
+            f.write(matrix.tobytes())
+            if scales is not None:
+                f.write(scales.tobytes())
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a flat vector index")
+            header_length = struct.unpack("<Q", f.read(8))[0]
+            header = json.loads(f.read(header_length).decode("utf-8"))
+
+        count, dim = header["count"], header["dim"]
+        matrix_offset = len(MAGIC) + 8 + header_length
+        matrix_offset += (-matrix_offset) % ALIGNMENT
+        if count == 0:
+            return cls(path, header, np.zeros((0, 0), dtype=np.float32), None)
+
+        dtype = np.int8 if header["dtype"] == "int8" else np.float16
+        matrix = np.memmap(path, dtype=dtype, mode="r", offset=matrix_offset, shape=(count, dim))
+        scales = None
+        if header["dtype"] == "int8":
+            scales = np.memmap(path, dtype=np.float32, mode="r",
+                               offset=matrix_offset + count * dim, shape=(count,))
+        return cls(path, header, matrix, scales)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, query_embedding, k):
+        if not self.ids:
+            return []
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+
+        similarities = np.asarray(self.matrix.dot(query), dtype=np.float32)
+        if self.scales is not None:
+            similarities = similarities * self.scales
+
+        k = min(k, len(self.ids))
+        top = np.argpartition(-similarities, k - 1)[:k]
+        top = top[np.argsort(-similarities[top])]
+
+        # Report squared L2 distance between unit vectors so scores sort the same
+        # way as Chroma's default distance.
+        return [
+            (Document(page_content=self.texts[i], metadata=dict(self.metadatas[i])),
+             float(2.0 - 2.0 * similarities[i]))
+            for i in top
+        ]
@@ -1,6 +1,43 @@
+import os
+import threading
+from pathlib import Path
 from langchain_ollama import OllamaEmbeddings
 
+EMBEDDING_BACKENDS = ("ollama", "local", "hash")
+
+_embedding_functions = {}
+_lock = threading.Lock()
+
+
+def get_embedding_backend():
+    backend = os.environ.get('HERMA_EMBEDDING_BACKEND', 'ollama').lower()
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend}, expected one of {', '.join(EMBEDDING_BACKENDS)}")
+    return backend
+
+
+def _create_embedding_function(backend):
+    if backend == "ollama":
+        return OllamaEmbeddings(model=os.environ.get('HERMA_OLLAMA_EMBEDDING_MODEL', 'all-minilm'))
+    if backend == "local":
+        from embedding_backends import LocalMiniLMEmbeddings, find_local_model_dir
+        storage_dir = Path(os.environ.get('ELECTRON_APP_DATA_DIR', '.')) / 'storage'
+        return LocalMiniLMEmbeddings(find_local_model_dir(storage_dir))
+    from embedding_backends import HashingEmbeddings
+    return HashingEmbeddings()
+
 
 def get_embedding_function():
-    embeddings = OllamaEmbeddings(model="all-minilm")
-    return embeddings
+    backend = get_embedding_backend()
+    with _lock:
+        embeddings = _embedding_functions.get(backend)
+        if embeddings is None:
+            embeddings = _embedding_functions[backend] = _create_embedding_function(backend)
+        return embeddings
+
+
+def get_embedding_id():
+    embeddings = get_embedding_function()
+    if isinstance(embeddings, OllamaEmbeddings):
+        return f"ollama:{embeddings.model}"
+    return embeddings.embedding_id
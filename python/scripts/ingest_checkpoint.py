@@ -0,0 +1,200 @@
+import os
+import json
+import hashlib
+import threading
+from pathlib import Path
+
+FINGERPRINT_SAMPLE_BYTES = 1024 * 1024
+MAX_RESUME_ATTEMPTS = 3
+
+# Checkpoint collections being written: collection -> [owning thread, source
+# file, claim count].
+_claimed = {}
+_claimed_changed = threading.Condition()
+
+
+def get_checkpoint_dir():
+    checkpoint_dir = Path(os.environ.get('ELECTRON_APP_DATA_DIR', '.')) / 'storage' / 'ingest_checkpoints'
+    os.makedirs(str(checkpoint_dir), exist_ok=True)
+    return checkpoint_dir
+
+
+def fingerprint_file(data_path):
+    # Size plus the first and last megabyte: cheap even for multi-gigabyte
+    # archives, and a re-upload of the same file matches even though the copy
+    # has a new mtime.
+    size = os.path.getsize(data_path)
+    digest = hashlib.sha256(str(size).encode("utf-8"))
+    with open(data_path, 'rb') as f:
+        digest.update(f.read(FINGERPRINT_SAMPLE_BYTES))
+        if size > FINGERPRINT_SAMPLE_BYTES:
+            f.seek(max(size - FINGERPRINT_SAMPLE_BYTES, FINGERPRINT_SAMPLE_BYTES))
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def _claim(checkpoint):
+    # Callers hold _claimed_changed. Claims are counted and re-entrant for the
+    # owning thread, so a checkpoint claimed by find() can be opened by the same
+    # upload and stays claimed until the outermost release().
+    claim = _claimed.setdefault(checkpoint.vector_database_path,
+                                [threading.get_ident(), checkpoint.state["data_path"], 0])
+    if claim[0] != threading.get_ident():
+        return False
+    claim[2] += 1
+    return True
+
+
+def is_file_claimed(data_path):
+    # True while another thread is resuming an ingestion that reads data_path.
+    target = os.path.abspath(str(data_path))
+    with _claimed_changed:
+        return any(owner != threading.get_ident() and os.path.abspath(path) == target
+                   for owner, path, _ in _claimed.values())
+
+
+class IngestCheckpoint:
+    # Extraction is deterministic for a given file and chunk size, so the cursor
+    # is the number of chunks already durably written. On resume those chunks are
+    # re-extracted but only checked against the store, not re-embedded.
+    def __init__(self, state):
+        self.state = state
+
+    @property
+    def vector_database_path(self):
+        return self.state["vector_database_path"]
+
+    @property
+    def timestamp(self):
+        return self.state["timestamp"]
+
+    @property
+    def chunks_committed(self):
+        return self.state["chunks_committed"]
+
+    @property
+    def last_chunk_id(self):
+        return self.state["last_chunk_id"]
+
+    @property
+    def path(self):
+        return get_checkpoint_dir() / f"{self.vector_database_path}.json"
+
+    @staticmethod
+    def pending():
+        checkpoints = []
+        for filename in os.listdir(str(get_checkpoint_dir())):
+            if not filename.endswith(".json"):
+                continue
+            try:
+                with open(get_checkpoint_dir() / filename, 'r', encoding='utf-8') as f:
+                    checkpoints.append(IngestCheckpoint(json.load(f)))
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable ingest checkpoint {filename}: {e}")
+        return checkpoints
+
+    @classmethod
+    def find(cls, data_path, chunk_size, embedding_id):
+        # Returns (checkpoint, in_flight). A matching checkpoint is claimed for the
+        # calling thread before it is returned; in_flight is one that another
+        # thread is already resuming, for the caller to wait on instead of
+        # indexing the same file a second time.
+        try:
+            fingerprint = fingerprint_file(data_path)
+        except OSError:
+            return None, None
+        in_flight = None
+        with _claimed_changed:
+            for checkpoint in cls.pending():
+                state = checkpoint.state
+                if state["fingerprint"] == fingerprint and state["chunk_size"] == chunk_size \
+                        and state["embedding_id"] == embedding_id:
+                    if _claim(checkpoint):
+                        return checkpoint, None
+                    in_flight = checkpoint
+        return None, in_flight
+
+    @classmethod
+    def open(cls, uploaded_data, embedding_id):
+        path = get_checkpoint_dir() / f"{uploaded_data.vector_database_path}.json"
+        checkpoint = None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                checkpoint = cls(json.load(f))
+        except (FileNotFoundError, ValueError):
+            pass
+
+        fingerprint = fingerprint_file(uploaded_data.data_path)
+        if checkpoint is None or checkpoint.state["fingerprint"] != fingerprint \
+                or checkpoint.state["embedding_id"] != embedding_id:
+            checkpoint = cls({
+                "name": uploaded_data.name,
+                "data_path": uploaded_data.data_path,
+                "chunk_size": uploaded_data.chunk_size,
+                "fingerprint": fingerprint,
+                "embedding_id": embedding_id,
+                "vector_database_path": uploaded_data.vector_database_path,
+                "timestamp": uploaded_data.timestamp,
+                "chunks_committed": 0,
+                "batches_committed": 0,
+                "last_chunk_id": None,
+                "attempts": 0
+            })
+
+        with _claimed_changed:
+            if not _claim(checkpoint):
+                raise RuntimeError(f"{uploaded_data.name} is already being indexed")
+        return checkpoint
+
+    def claim(self):
+        # Returns False when another thread is already writing this collection.
+        with _claimed_changed:
+            return _claim(self)
+
+    def wait_released(self):
+        with _claimed_changed:
+            while self.vector_database_path in _claimed:
+                _claimed_changed.wait()
+
+    def save(self):
+        temp_file = f"{self.path}.tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f)
+        os.replace(temp_file, self.path)
+
+    def commit(self, chunks_committed, last_chunk_id):
+        self.state["chunks_committed"] = chunks_committed
+        self.state["batches_committed"] += 1
+        self.state["last_chunk_id"] = last_chunk_id
+        self.save()
+
+    def restart(self):
+        self.state["chunks_committed"] = 0
+        self.state["batches_committed"] = 0
+        self.state["last_chunk_id"] = None
+        self.save()
+
+    def record_failure(self):
+        # Returns False once a file has failed to resume too often to keep trying.
+        self.state["attempts"] += 1
+        if self.state["attempts"] >= MAX_RESUME_ATTEMPTS:
+            self.delete()
+            return False
+        self.save()
+        return True
+
+    def release(self):
+        with _claimed_changed:
+            claim = _claimed.get(self.vector_database_path)
+            if claim is None or claim[0] != threading.get_ident():
+                return
+            claim[2] -= 1
+            if claim[2] <= 0:
+                del _claimed[self.vector_database_path]
+                _claimed_changed.notify_all()
+
+    def delete(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,291 @@
+import os
+import sys
+import time
+import uuid
+import queue
+import pickle
+import shutil
+import threading
+import multiprocessing
+from pathlib import Path
+import psutil
+from langchain_core.documents import Document
+
+# Start workers with spawn everywhere: forking a process that already runs chat
+# threads and holds Chroma handles is not safe.
+_context = multiprocessing.get_context("spawn")
+
+
+class IngestionError(RuntimeError):
+    pass
+
+
+# How often the supervisor thread samples busy workers' resident memory.
+MEMORY_CHECK_INTERVAL = 0.5
+
+
+def process_rss_bytes(pid):
+    # An address-space rlimit would also count the mappings of everything the
+    # worker imports, and does not exist on Windows, so the limit is enforced
+    # from the supervisor on what the worker actually has resident.
+    try:
+        return psutil.Process(pid).memory_info().rss
+    except (psutil.NoSuchProcess, psutil.AccessDenied):
+        return None
+
+
+def _worker_main(conn, batch_dir, batch_size):
+    # stdout carries the JSON protocol of the parent process.
+    sys.stdout = sys.stderr
+
+    from uploaded_data import Uploaded_data
+
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+
+        task_id, data_path, chunk_size = task
+        task_dir = os.path.join(batch_dir, task_id)
+        try:
+            os.makedirs(task_dir, exist_ok=True)
+            extractor = Uploaded_data.__new__(Uploaded_data)
+            extractor.chunk_size = chunk_size
+
+            batch = []
+            batch_index = 0
+            for chunk in extractor.iter_chunks(extractor.load_documents(data_path)):
+                batch.append((chunk.page_content, chunk.metadata))
+                if len(batch) >= batch_size:
+                    conn.send(("batch", _write_batch(task_dir, batch_index, batch)))
+                    batch = []
+                    batch_index += 1
+            if batch:
+                conn.send(("batch", _write_batch(task_dir, batch_index, batch)))
+            conn.send(("done", None))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+def _write_batch(task_dir, batch_index, batch):
+    batch_path = os.path.join(task_dir, f"batch_{batch_index:06d}.pkl")
+    temp_path = f"{batch_path}.tmp"
+    with open(temp_path, 'wb') as f:
+        pickle.dump(batch, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, batch_path)
+    return batch_path
+
+
+class _Worker:
+    def __init__(self, batch_dir, batch_size):
+        self.conn, child_conn = _context.Pipe()
+        self.process = _context.Process(
+            target=_worker_main,
+            args=(child_conn, batch_dir, batch_size),
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.tasks_done = 0
+        self.busy = False
+        self.memory_exceeded = False
+
+    def is_alive(self):
+        return self.process.is_alive()
+
+    def stop(self, timeout=2):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout)
+        self.kill()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join(5)
+        self.conn.close()
+
+
+class IngestionPool:
+    # Parsing and splitting run in worker processes so they neither hold the GIL
+    # while chat is streaming nor take the server down when a native parser
+    # crashes. Workers hand chunks back as pickled batches on disk, and a worker
+    # that crashes, runs out of memory or stalls on a file is replaced.
+    def __init__(self, batch_dir, max_workers=2, memory_limit_mb=2048, file_timeout=600, batch_size=64,
+                 max_tasks_per_worker=50):
+        self.batch_dir = str(batch_dir)
+        self.max_workers = max_workers
+        self.memory_limit_mb = memory_limit_mb
+        self.file_timeout = file_timeout
+        self.batch_size = batch_size
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self._idle = queue.Queue()
+        for _ in range(max_workers):
+            self._idle.put(None)
+        self._workers = set()
+        self._lock = threading.Lock()
+        self._closed = False
+        self.peak_worker_rss = 0
+        self._stop_event = threading.Event()
+
+        # Batches left behind by a previous run can never be claimed.
+        shutil.rmtree(self.batch_dir, ignore_errors=True)
+        os.makedirs(self.batch_dir, exist_ok=True)
+
+        # A separate thread, because the consumer of iter_chunks() spends most of
+        # its time embedding with the generator suspended.
+        self._memory_thread = threading.Thread(target=self._watch_memory, daemon=True)
+        self._memory_thread.start()
+
+    def _acquire(self):
+        worker = self._idle.get()
+        if worker is not None and not worker.is_alive():
+            self._discard(worker)
+            worker = None
+        if worker is None:
+            try:
+                worker = _Worker(self.batch_dir, self.batch_size)
+            except Exception:
+                self._idle.put(None)
+                raise
+            with self._lock:
+                self._workers.add(worker)
+        return worker
+
+    def _release(self, worker, healthy):
+        if healthy and not self._closed:
+            worker.tasks_done += 1
+            if worker.tasks_done < self.max_tasks_per_worker:
+                self._idle.put(worker)
+                return
+            # Recycle long-lived workers so fragmented parser memory is returned.
+            worker.stop()
+        else:
+            worker.kill()
+        self._discard(worker)
+        self._idle.put(None)
+
+    def _discard(self, worker):
+        with self._lock:
+            self._workers.discard(worker)
+
+    def _watch_memory(self):
+        while not self._stop_event.wait(MEMORY_CHECK_INTERVAL):
+            with self._lock:
+                workers = [worker for worker in self._workers if worker.busy]
+            for worker in workers:
+                rss = process_rss_bytes(worker.process.pid)
+                if rss is None:
+                    continue
+                self.peak_worker_rss = max(self.peak_worker_rss, rss)
+                if self.memory_limit_mb and rss > self.memory_limit_mb * 1024 * 1024:
+                    worker.memory_exceeded = True
+                    try:
+                        worker.process.kill()
+                    except Exception:
+                        pass
+
+    def _crashed(self, worker, data_path):
+        if worker.memory_exceeded:
+            return IngestionError(f"Ingestion worker exceeded {self.memory_limit_mb} MB extracting "
+                                  f"{os.path.basename(data_path)}")
+        return IngestionError(f"Ingestion worker crashed on {os.path.basename(data_path)} "
+                              f"(exit code {worker.process.exitcode})")
+
+    def iter_chunks(self, data_path, chunk_size):
+        if self._closed:
+            raise IngestionError("Ingestion pool is shut down")
+
+        worker = self._acquire()
+        task_id = uuid.uuid4().hex
+        healthy = False
+        worker.busy = True
+        try:
+            worker.conn.send((task_id, data_path, chunk_size))
+            # Only time spent blocked on the worker counts against the limit, so a
+            # slow embedding backend downstream cannot time a healthy parse out.
+            waited = 0.0
+            while True:
+                if not worker.conn.poll(0):
+                    started = time.monotonic()
+                    ready = worker.conn.poll(min(1.0, max(self.file_timeout - waited, 0)))
+                    waited += time.monotonic() - started
+                    if not ready:
+                        if not worker.is_alive():
+                            raise self._crashed(worker, data_path)
+                        if waited >= self.file_timeout:
+                            raise IngestionError(f"Timed out after {self.file_timeout:.0f}s extracting "
+                                                 f"{os.path.basename(data_path)}")
+                        continue
+
+                try:
+                    kind, value = worker.conn.recv()
+                except (EOFError, OSError):
+                    worker.process.join(5)
+                    raise self._crashed(worker, data_path)
+
+                if kind == "batch":
+                    with open(value, 'rb') as f:
+                        batch = pickle.load(f)
+                    os.remove(value)
+                    for page_content, metadata in batch:
+                        yield Document(page_content=page_content, metadata=metadata)
+                elif kind == "done":
+                    healthy = True
+                    return
+                else:
+                    # The parser raised, but the worker itself is fine.
+                    healthy = True
+                    raise IngestionError(value)
+        finally:
+            # A worker abandoned half way (crash, timeout or the consumer stopped
+            # reading) may still be writing batches, so it is killed, not reused.
+            worker.busy = False
+            self._release(worker, healthy)
+            shutil.rmtree(os.path.join(self.batch_dir, task_id), ignore_errors=True)
+
+    def shutdown(self):
+        self._closed = True
+        self._stop_event.set()
+        with self._lock:
+            workers = list(self._workers)
+            self._workers.clear()
+        for worker in workers:
+            worker.stop()
+
+
+_ingestion_pool = None
+_ingestion_pool_lock = threading.Lock()
+
+
+def get_ingestion_pool():
+    global _ingestion_pool
+    max_workers = int(os.environ.get('HERMA_INGEST_WORKERS', '2'))
+    if max_workers <= 0:
+        return None
+    with _ingestion_pool_lock:
+        if _ingestion_pool is None:
+            storage_dir = Path(os.environ.get('ELECTRON_APP_DATA_DIR', '.')) / 'storage'
+            _ingestion_pool = IngestionPool(
+                storage_dir / 'ingest_batches',
+                max_workers=max_workers,
+                memory_limit_mb=int(os.environ.get('HERMA_INGEST_MEMORY_MB', '2048')),
+                file_timeout=float(os.environ.get('HERMA_INGEST_FILE_TIMEOUT', '600'))
+            )
+        return _ingestion_pool
+
+
+def shutdown_ingestion_pool():
+    with _ingestion_pool_lock:
+        if _ingestion_pool is not None:
+            _ingestion_pool.shutdown()
+
+
+def peak_worker_rss_bytes():
+    with _ingestion_pool_lock:
+        return _ingestion_pool.peak_worker_rss if _ingestion_pool is not None else 0
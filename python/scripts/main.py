@@ -4,15 +4,34 @@ import json
 import shutil
 import atexit
 from pathlib import Path
-from session import Session
+from session_pool import SessionPool, DEFAULT_SESSION_ID
 from uploaded_data import Uploaded_data
+from watched_folder import WatchedFolder, FolderWatcher
+from batch_upload import BatchUpload
 from data_store import DataStore
+from answer_cache import AnswerCache
+from ollama_stream import CancelToken
+from storage_manager import get_storage_manager
+from ingest_workers import shutdown_ingestion_pool, peak_worker_rss_bytes
+from ingest_checkpoint import IngestCheckpoint, is_file_claimed
+from get_embedding_function import get_embedding_id
+import multiprocessing
 import signal
 import platform
+import threading
+import time
+import tracing
 
 class PythonServer:
     def __init__(self):
+        # stdout carries the JSON protocol and is only written through send() and
+        # log() under the output lock. print() writes the text and the newline
+        # separately, so a diagnostic from another thread could split a protocol
+        # line; every print() goes to stderr instead.
+        self.protocol_stream = sys.stdout
+        sys.stdout = sys.stderr
         self.active_requests = {}
+        self._output_lock = threading.Lock()
         root_dir = Path(__file__).parent.parent.parent
         self.storage_dir = Path(os.environ.get('ELECTRON_APP_DATA_DIR', '.')) / "storage"
         self.upload_dir = self.storage_dir / "uploads"
@@ -32,11 +51,58 @@ class PythonServer:
         atexit.register(self.clean_exit)
 
         self.uploaded_data_store = DataStore(pickle_path)
-        self.session = Session(currently_used_data=[])
+        self.answer_cache = None
+        if AnswerCache.is_enabled():
+            self.answer_cache = AnswerCache(
+                str(self.storage_dir.resolve() / "answer_cache.pkl"),
+                similarity_threshold=float(os.environ.get('HERMA_ANSWER_CACHE_THRESHOLD', '0.95'))
+            )
+        self.session_pool = SessionPool(
+            self.storage_dir,
+            self.uploaded_data_store,
+            answer_cache=self.answer_cache,
+            max_live_sessions=int(os.environ.get('HERMA_MAX_LIVE_SESSIONS', '8')),
+            idle_timeout=float(os.environ.get('HERMA_SESSION_IDLE_TIMEOUT', '900')),
+            max_concurrent_generations=int(os.environ.get('HERMA_MAX_CONCURRENT_GENERATIONS', '1'))
+        )
+        self.folder_watcher = FolderWatcher(
+            self.uploaded_data_store,
+            interval=float(os.environ.get('HERMA_WATCH_INTERVAL', '30'))
+        )
+        self.folder_watcher.start()
+
+        self.storage_manager = get_storage_manager()
+        for uploaded_data in self.uploaded_data_store.data:
+            self.storage_manager.adopt(uploaded_data)
+        self.storage_manager.start(
+            lambda: {data.vector_database_path for data in self.uploaded_data_store.data}
+            | {checkpoint.vector_database_path for checkpoint in IngestCheckpoint.pending()},
+            interval=float(os.environ.get('HERMA_STORAGE_GC_INTERVAL', '600'))
+        )
+        threading.Thread(target=self.resume_interrupted_uploads, daemon=True).start()
+
+        tracing.metrics.register_gauge("chat.queue_depth", lambda: self.session_pool.waiting_generations)
+        tracing.metrics.register_gauge("chat.active_requests", lambda: len(self.active_requests))
+        tracing.metrics.register_gauge("sessions.live", lambda: len(self.session_pool.sessions))
+        tracing.metrics.register_gauge("ingest.worker_peak_rss_bytes", peak_worker_rss_bytes)
         self.is_running = True
 
+    def send(self, message):
+        line = json.dumps(message) + "\n"
+        with self._output_lock:
+            self.protocol_stream.write(line)
+            self.protocol_stream.flush()
+
+    def log(self, text):
+        with self._output_lock:
+            self.protocol_stream.write(text + "\n")
+            self.protocol_stream.flush()
+
     def clean_exit(self):
         if self.is_running:
+            self.folder_watcher.stop()
+            self.storage_manager.stop()
+            shutdown_ingestion_pool()
 
             try:
                 self.uploaded_data_store.save()
@@ -50,17 +116,80 @@ class PythonServer:
         self.clean_exit()
         sys.exit(0)
 
+    def handle_metrics(self, request_id):
+        try:
+            self.send({
+                "requestId": request_id,
+                "enabled": tracing.METRICS_ENABLED,
+                "metrics": tracing.metrics.snapshot(),
+                "success": True,
+                "done": True
+            })
+        except Exception as e:
+            self.send({
+                "requestId": request_id,
+                "error": f"Metrics failed: {str(e)}"
+            })
+
+    def resume_interrupted_uploads(self):
+        for checkpoint in IngestCheckpoint.pending():
+            state = checkpoint.state
+            # A re-upload of the same file may already be resuming this checkpoint,
+            # or may have finished it since pending() was read.
+            if not checkpoint.claim():
+                continue
+            try:
+                if not checkpoint.path.exists():
+                    continue
+                if any(data.vector_database_path == checkpoint.vector_database_path
+                       for data in self.uploaded_data_store.data):
+                    checkpoint.delete()
+                    continue
+                if not os.path.exists(state["data_path"]):
+                    checkpoint.delete()
+                    self.storage_manager.remove(checkpoint.vector_database_path)
+                    continue
+                file_data = Uploaded_data(state["name"], state["data_path"], True, state["chunk_size"])
+                self.uploaded_data_store.add(file_data)
+                self.uploaded_data_store.save()
+                self.log(f"Resumed interrupted upload of {state['name']}")
+            except Exception as e:
+                self.log(f"Could not resume upload of {state['name']}: {e}")
+            finally:
+                checkpoint.release()
+
+    def handle_storage_usage(self, request_id):
+        try:
+            self.send({
+                "requestId": request_id,
+                "usage": self.storage_manager.usage(),
+                "success": True,
+                "done": True
+            })
+        except Exception as e:
+            self.send({
+                "requestId": request_id,
+                "error": f"Storage usage failed: {str(e)}"
+            })
+
     def handle_ping(self, request_id):
-        print(json.dumps({
+        self.send({
             "requestId": request_id,
             "success": True,
             "done": True
-        }), flush=True)
-
-    def process_chat(self, message, request_id):
+        })
+
+    def process_chat(self, message, request_id, cancel_token, session_id=None, first_token_timeout=None,
+                     deadline=None, trace=False):
+        session_id = session_id or DEFAULT_SESSION_ID
+        slot_acquired = False
+        request_trace = None
+        if trace:
+            request_trace = tracing.start_trace(
+                lambda timing: self.send({"requestId": request_id, "timing": timing})
+            )
+        chat_started = time.perf_counter()
         try:
-            self.active_requests[request_id] = "active"
-
             if message.startswith("_BASE64_"):
                 import base64
                 encoded_part = message[len("_BASE64_"):]
@@ -68,74 +197,139 @@ class PythonServer:
                     message = base64.b64decode(encoded_part).decode('utf-8')
                 except Exception as e:
                     print(f"Error decoding message: {e}")
-            response_generator = self.session.ask(message)
 
+            with tracing.span("chat.queue_wait"):
+                slot_acquired = self.session_pool.acquire_generation_slot(session_id, cancel_token)
+            if not slot_acquired or cancel_token.cancelled:
+                self.send({
+                    "requestId": request_id,
+                    "done": True
+                })
+                return
+
+            session = self.session_pool.get(session_id)
+            response_generator = session.ask(message, first_token_timeout=first_token_timeout, deadline=deadline,
+                                             cancel_token=cancel_token)
+
+            first_chunk = True
             for chunk in response_generator:
-                if self.active_requests.get(request_id) == "interrupted":
-                    print(json.dumps({
+                if first_chunk:
+                    first_chunk = False
+                    tracing.record("chat.first_token", time.perf_counter() - chat_started)
+
+                if cancel_token.cancelled:
+                    response_generator.close()
+                    self.send({
                         "requestId": request_id,
                         "done": True
-                    }), flush=True)
-                    self.active_requests.pop(request_id, None)
+                    })
                     return
 
-                print(json.dumps({
+                response = {
                     "requestId": request_id,
                     "chunk": chunk
-                }), flush=True)
+                }
+                if session.last_response_cached:
+                    response["cached"] = True
+                self.send(response)
 
-            print(json.dumps({
+            tracing.record("chat.total", time.perf_counter() - chat_started)
+            response = {
                 "requestId": request_id,
                 "done": True
-            }), flush=True)
-            print("DEBUG: Python sent done signal", flush=True)
-
-            self.active_requests.pop(request_id, None)
+            }
+            if session.last_response_cached:
+                response["cached"] = True
+            if request_trace is not None:
+                response["timings"] = request_trace.timings
+            self.send(response)
+            self.log("DEBUG: Python sent done signal")
         except Exception as e:
-            print(json.dumps({
+            self.send({
                 "requestId": request_id,
                 "error": str(e)
-            }), flush=True)
+            })
+        finally:
+            if slot_acquired:
+                self.session_pool.release_generation_slot(session_id)
             self.active_requests.pop(request_id, None)
+            if request_trace is not None:
+                tracing.end_trace()
 
     def handle_shutdown(self, request_id):
         self.is_running = False
-        print(json.dumps({
+        self.send({
             "requestId": request_id,
             "success": True,
             "done": True
-        }), flush=True)
+        })
 
-    def handle_new_session(self, request_id):
+    def handle_new_session(self, request_id, data):
         try:
-            self.session = Session(currently_used_data=[])
+            self.session_pool.new_session(data.get('sessionId'))
 
-            print(json.dumps({
+            self.send({
                 "requestId": request_id,
                 "success": True,
                 "done": True
-            }), flush=True)
+            })
         except Exception as e:
-            print(json.dumps({
+            self.send({
                 "requestId": request_id,
                 "error": f"New session creation failed: {str(e)}"
-            }), flush=True)
+            })
+
+    def handle_close_session(self, request_id, data):
+        try:
+            session_id = data.get('sessionId')
+            if not session_id:
+                raise ValueError("Missing sessionId")
+
+            self.session_pool.close(session_id)
+
+            self.send({
+                "requestId": request_id,
+                "success": True,
+                "done": True
+            })
+        except Exception as e:
+            self.send({
+                "requestId": request_id,
+                "error": f"Close session failed: {str(e)}"
+            })
+
+    def handle_list_sessions(self, request_id):
+        try:
+            live_sessions, evicted_sessions = self.session_pool.list_sessions()
+
+            self.send({
+                "requestId": request_id,
+                "sessions": live_sessions,
+                "evictedSessions": evicted_sessions,
+                "success": True,
+                "done": True
+            })
+        except Exception as e:
+            self.send({
+                "requestId": request_id,
+                "error": f"List sessions failed: {str(e)}"
+            })
 
     def handle_get_files(self, request_id):
         try:
             filenames = [uploaded_data.name for uploaded_data in self.uploaded_data_store.data]
 
-            print(json.dumps({
+            self.send({
                 "requestId": request_id,
                 "files": filenames,
                 "success": True,
                 "done": True
-            }), flush=True)
+            })
         except Exception as e:
-            print(json.dumps({
+            self.send({
                 "requestId": request_id,
                 "error": f"Get files failed: {str(e)}"
-            }), flush=True)
+            })
 
     def handle_select(self, request_id, data):
         try:
@@ -146,19 +340,19 @@ class PythonServer:
                 if uploaded_data.name in filenames:
                     selected_files.append(uploaded_data)
 
-            self.session.currently_used_data = selected_files
+            self.session_pool.get(data.get('sessionId')).currently_used_data = selected_files
 
-            print(json.dumps({
+            self.send({
                 "requestId": request_id,
                 "success": True,
                 "done": True
-            }), flush=True)
+            })
 
         except Exception as e:
-            print(json.dumps({
+            self.send({
                 "requestId": request_id,
                 "error": f"Selection failed: {str(e)}"
-            }), flush=True)
+            })
 
     def handle_interrupt(self, request_id, data):
         try:
@@ -166,23 +360,25 @@ class PythonServer:
             if not target_request_id:
                 raise ValueError("Missing target requestId")
 
-            self.active_requests[target_request_id] = "interrupted"
+            # A request that is no longer registered has already finished.
+            cancel_token = self.active_requests.get(target_request_id)
 
-            self.session.cancel_generation()
+            # Only confirm once the stream to Ollama has been torn down, so the
+            # backend is free for the next request when the UI gets the reply.
+            if cancel_token is not None and not cancel_token.cancel():
+                raise RuntimeError("Generation did not stop in time")
 
-            print(json.dumps({
+            self.send({
                 "requestId": request_id,
                 "success": True,
                 "done": True
-            }), flush=True)
-
-            self.active_requests.pop(target_request_id, None)
+            })
 
         except Exception as e:
-            print(json.dumps({
+            self.send({
                 "requestId": request_id,
                 "error": f"Interrupt failed: {str(e)}"
-            }), flush=True)
+            })
 
     def handle_delete(self, request_id, data):
         try:
@@ -201,25 +397,36 @@ class PythonServer:
                 if file_path.exists():
                     file_path.unlink()
 
-                Uploaded_data.delete_vector_db(filename)
+                deleted_data = self.uploaded_data_store.get(file_index)
+                self.storage_manager.remove(deleted_data.vector_database_path)
+                if isinstance(deleted_data, WatchedFolder):
+                    deleted_data.remove_file_state()
+                if self.answer_cache is not None:
+                    self.answer_cache.forget_documents(deleted_data.vector_database_path)
 
                 self.uploaded_data_store.delete(file_index)
 
-                self.session.currently_used_data = self.uploaded_data_store.data
+                self.session_pool.remove_data(deleted_data)
+                self.session_pool.get(data.get('sessionId')).currently_used_data = self.uploaded_data_store.data
 
-            print(json.dumps({
+            self.send({
                 "requestId": request_id,
                 "success": True,
                 "done": True
-            }), flush=True)
+            })
 
         except Exception as e:
-            print(json.dumps({
+            self.send({
                 "requestId": request_id,
                 "error": f"Delete failed: {str(e)}"
-            }), flush=True)
+            })
 
     def handle_upload(self, request_id, data):
+        request_trace = None
+        if data.get('trace'):
+            request_trace = tracing.start_trace(
+                lambda timing: self.send({"requestId": request_id, "timing": timing})
+            )
         try:
             filename = data.get('filename')
             filepath = data.get('filepath')
@@ -227,40 +434,166 @@ class PythonServer:
             if not filename or not filepath:
                 raise ValueError("Missing filename or filepath")
 
-            destination = self.upload_dir / filename
+            checkpoint, in_flight = IngestCheckpoint.find(filepath, 400, get_embedding_id())
+            if in_flight is not None:
+                # The startup resume is already indexing this file. Answer once it
+                # finishes instead of blocking the input loop or indexing it twice.
+                threading.Thread(
+                    target=self.attach_to_resume,
+                    args=(request_id, data, in_flight),
+                    daemon=True
+                ).start()
+                return
 
-            if destination.exists():
-                destination.unlink()
+            try:
+                destination = self.upload_dir / filename
+                if is_file_claimed(destination):
+                    raise RuntimeError(f"An earlier upload of {filename} is still being indexed")
 
-            shutil.move(filepath, destination)
+                if destination.exists():
+                    destination.unlink()
 
-            file_data = Uploaded_data(filename, str(destination), True, 400)
+                shutil.move(filepath, destination)
 
-            self.uploaded_data_store.add(file_data)
+                file_data = Uploaded_data(filename, str(destination), True, 400)
 
-            self.session.currently_used_data = self.uploaded_data_store.data
+                self.uploaded_data_store.add(file_data)
+            finally:
+                if checkpoint is not None:
+                    checkpoint.release()
 
-            print(json.dumps({
+            self.session_pool.get(data.get('sessionId')).currently_used_data = self.uploaded_data_store.data
+
+            response = {
                 "requestId": request_id,
                 "success": True,
                 "done": True
-            }), flush=True)
+            }
+            if request_trace is not None:
+                response["timings"] = request_trace.timings
+            self.send(response)
 
         except Exception as e:
-            print(json.dumps({
+            self.send({
                 "requestId": request_id,
                 "error": f"Upload failed: {str(e)}"
-            }), flush=True)
+            })
+        finally:
+            if request_trace is not None:
+                tracing.end_trace()
+
+    def attach_to_resume(self, request_id, data, checkpoint):
+        checkpoint.wait_released()
+        file_data = next((file_data for file_data in self.uploaded_data_store.data
+                          if file_data.vector_database_path == checkpoint.vector_database_path), None)
+        if file_data is None:
+            # The resume failed; index the upload itself, picking up whatever
+            # the resume left behind.
+            self.handle_upload(request_id, data)
+            return
+
+        try:
+            os.remove(data['filepath'])
+        except OSError:
+            pass
+        self.session_pool.get(data.get('sessionId')).currently_used_data = self.uploaded_data_store.data
+        self.send({
+            "requestId": request_id,
+            "success": True,
+            "done": True
+        })
+
+    def handle_upload_batch(self, request_id, data):
+        try:
+            files = data.get('files')
+            if not files:
+                raise ValueError("Missing files")
+
+            to_index = []
+            for file in files:
+                filename = file.get('filename')
+                filepath = file.get('filepath')
+                try:
+                    if not filename or not filepath:
+                        raise ValueError("Missing filename or filepath")
+                    destination = self.upload_dir / filename
+                    if is_file_claimed(destination):
+                        raise RuntimeError(f"An earlier upload of {filename} is still being indexed")
+                    if destination.exists():
+                        destination.unlink()
+                    shutil.move(filepath, destination)
+                    to_index.append((filename, str(destination)))
+                except Exception as e:
+                    self.send({
+                        "requestId": request_id,
+                        "file": {"name": filename, "success": False, "error": str(e)}
+                    })
+
+            def on_result(name, file_data, error):
+                if file_data is not None:
+                    self.uploaded_data_store.add(file_data)
+                self.send({
+                    "requestId": request_id,
+                    "file": {"name": name, "success": error is None, "error": error}
+                })
+
+            results = BatchUpload(to_index, 400, on_result).run()
+
+            self.session_pool.get(data.get('sessionId')).currently_used_data = self.uploaded_data_store.data
+
+            self.send({
+                "requestId": request_id,
+                "indexed": sum(1 for result in results if result["success"]),
+                "failed": len(files) - sum(1 for result in results if result["success"]),
+                "success": True,
+                "done": True
+            })
+
+        except Exception as e:
+            self.send({
+                "requestId": request_id,
+                "error": f"Batch upload failed: {str(e)}"
+            })
+
+    def handle_watch_folder(self, request_id, data):
+        try:
+            folder_path = data.get('path')
+            if not folder_path:
+                raise ValueError("Missing path")
+
+            name = data.get('name') or os.path.basename(os.path.normpath(folder_path))
+            if any(uploaded_data.name == name for uploaded_data in self.uploaded_data_store.data):
+                raise ValueError(f"A file or folder named {name} already exists")
+
+            folder = WatchedFolder(name, folder_path, 400)
+
+            self.uploaded_data_store.add(folder)
+
+            self.session_pool.get(data.get('sessionId')).currently_used_data = self.uploaded_data_store.data
+
+            self.send({
+                "requestId": request_id,
+                "name": name,
+                "files": len(folder.load_file_state()),
+                "success": True,
+                "done": True
+            })
+
+        except Exception as e:
+            self.send({
+                "requestId": request_id,
+                "error": f"Watch folder failed: {str(e)}"
+            })
 
     def run(self):
         while self.is_running:
             try:
-                print("Waiting for input...", flush=True)  # Add this debug line
+                self.log("Waiting for input...")  # Add this debug line
                 line = sys.stdin.readline()
                 if not line:
-                    print("Empty line received, breaking loop", flush=True)  # Add this debug line
+                    self.log("Empty line received, breaking loop")  # Add this debug line
                     break
-                print(f"Received input: {line[:50]}...", flush=True)  # Add this to see what's coming in
+                self.log(f"Received input: {line[:50]}...")  # Add this to see what's coming in
 
                 data = json.loads(line)
                 request_id = data.get('requestId')
@@ -270,11 +603,45 @@ class PythonServer:
                 if command == 'ping':
                     self.handle_ping(request_id)
                 elif command == 'chat':
-                    self.process_chat(payload['message'], request_id)
+                    # Chats run off the input loop so an interrupt can be read
+                    # while the model is still evaluating the prompt. The request
+                    # is registered here so an interrupt that arrives before the
+                    # thread gets going is not lost.
+                    cancel_token = CancelToken()
+                    self.active_requests[request_id] = cancel_token
+                    chat_thread = threading.Thread(
+                        target=self.process_chat,
+                        args=(payload['message'], request_id, cancel_token),
+                        kwargs={
+                            "session_id": payload.get('sessionId'),
+                            "first_token_timeout": payload.get('firstTokenTimeout'),
+                            "deadline": payload.get('deadline'),
+                            "trace": bool(payload.get('trace'))
+                        },
+                        daemon=True
+                    )
+                    chat_thread.start()
                 elif command == 'upload':
                     self.handle_upload(request_id, payload)
+                elif command == 'upload_batch':
+                    threading.Thread(
+                        target=self.handle_upload_batch,
+                        args=(request_id, payload),
+                        daemon=True
+                    ).start()
                 elif command == 'interrupt':
                     self.handle_interrupt(request_id, payload)
+                elif command == 'watch_folder':
+                    # Indexing the whole tree and summarizing it can take minutes.
+                    threading.Thread(
+                        target=self.handle_watch_folder,
+                        args=(request_id, payload),
+                        daemon=True
+                    ).start()
+                elif command == 'metrics':
+                    self.handle_metrics(request_id)
+                elif command == 'storage_usage':
+                    self.handle_storage_usage(request_id)
                 elif command == 'delete':
                     self.handle_delete(request_id, payload)
                 elif command == 'select':
@@ -282,14 +649,18 @@ class PythonServer:
                 elif command == 'shutdown':
                     self.handle_shutdown(request_id)
                 elif command == 'new_session':
-                    self.handle_new_session(request_id)
+                    self.handle_new_session(request_id, payload)
+                elif command == 'close_session':
+                    self.handle_close_session(request_id, payload)
+                elif command == 'list_sessions':
+                    self.handle_list_sessions(request_id)
                 elif command == 'get_files':
                     self.handle_get_files(request_id)
                 else:
-                    print(json.dumps({
+                    self.send({
                         "requestId": request_id,
                         "error": f"Unknown command: {command}"
-                    }), flush=True)
+                    })
 
             except Exception as e:
                 error_msg = {
@@ -297,11 +668,13 @@ class PythonServer:
                 }
                 if 'request_id' in locals():
                     error_msg["requestId"] = request_id
-                print(json.dumps(error_msg), flush=True)
+                self.send(error_msg)
         self.uploaded_data_store.save()
 
 
 if __name__ == "__main__":
+    # Ingestion workers are spawned from the frozen executable too.
+    multiprocessing.freeze_support()
     try:
         server = PythonServer()
         server.run()
@@ -0,0 +1,167 @@
+import os
+import json
+import socket
+import threading
+import http.client
+from urllib.parse import urlparse
+
+
+class GenerationCancelled(Exception):
+    pass
+
+
+class GenerationTimeout(Exception):
+    pass
+
+
+def get_ollama_address():
+    host = os.environ.get('OLLAMA_HOST', '127.0.0.1:11434')
+    if '://' not in host:
+        host = f"http://{host}"
+    parsed = urlparse(host)
+    hostname = parsed.hostname or '127.0.0.1'
+    if hostname == '0.0.0.0':
+        hostname = '127.0.0.1'
+    return hostname, parsed.port or 11434
+
+
+# Closing the HTTP connection is what makes Ollama stop evaluating the prompt or
+# generating tokens, so cancel() and the deadline timer tear the socket down
+# instead of waiting for the next chunk to arrive.
+class OllamaGeneration:
+    def __init__(self, model, prompt, options, first_token_timeout=120, deadline=600):
+        self.model = model
+        self.prompt = prompt
+        self.options = options
+        self.first_token_timeout = first_token_timeout
+        self.deadline = deadline
+        self.cancelled = False
+        self.timed_out = False
+        self._conn = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._deadline_timer = None
+
+    def stream(self):
+        host, port = get_ollama_address()
+        body = json.dumps({
+            "model": self.model,
+            "prompt": self.prompt,
+            "raw": True,
+            "stream": True,
+            "options": self.options
+        })
+
+        try:
+            with self._lock:
+                if self.cancelled:
+                    raise GenerationCancelled()
+                self._conn = http.client.HTTPConnection(host, port, timeout=self.first_token_timeout)
+
+            if self.deadline:
+                self._deadline_timer = threading.Timer(self.deadline, self._expire)
+                self._deadline_timer.daemon = True
+                self._deadline_timer.start()
+
+            try:
+                self._conn.request("POST", "/api/generate", body=body, headers={"Content-Type": "application/json"})
+                response = self._conn.getresponse()
+                if response.status != 200:
+                    raise RuntimeError(f"Ollama returned {response.status}: {response.read().decode('utf-8', 'replace')}")
+
+                first_token = True
+                for line in response:
+                    if not line.strip():
+                        continue
+                    data = json.loads(line)
+                    if "error" in data:
+                        raise RuntimeError(f"Ollama error: {data['error']}")
+
+                    if first_token:
+                        first_token = False
+                        # Prompt evaluation is over; from here on only the overall
+                        # deadline applies, enforced by the timer.
+                        self._conn.sock.settimeout(None)
+
+                    text = data.get("response", "")
+                    if text:
+                        yield text
+                    if data.get("done"):
+                        break
+            except Exception as e:
+                # Tearing the socket down under http.client can surface as almost
+                # any error from the reading thread.
+                if self.cancelled:
+                    raise GenerationCancelled() from e
+                if self.timed_out or isinstance(e, socket.timeout):
+                    self.timed_out = True
+                    raise GenerationTimeout("Timed out waiting for the language model") from e
+                raise
+
+            if self.cancelled:
+                raise GenerationCancelled()
+            if self.timed_out:
+                raise GenerationTimeout("Generation exceeded its deadline")
+        finally:
+            self._close()
+            self._stopped.set()
+
+    def cancel(self):
+        self.cancelled = True
+        self._close()
+
+    def wait_stopped(self, timeout=None):
+        return self._stopped.wait(timeout)
+
+    def _expire(self):
+        self.timed_out = True
+        self._close()
+
+    def _close(self):
+        with self._lock:
+            if self._deadline_timer is not None:
+                self._deadline_timer.cancel()
+                self._deadline_timer = None
+            conn = self._conn
+            if conn is None:
+                return
+            sock = conn.sock
+            if sock is not None:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            conn.close()
+
+
+# One token per chat request. An interrupt can arrive before the request has a
+# generation (still queued, retrieving or replaying a cached answer), so the
+# token remembers it and cancels the generation as soon as one is attached.
+class CancelToken:
+    def __init__(self):
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._generation = None
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def attach(self, generation):
+        with self._lock:
+            self._generation = generation
+            if self.cancelled:
+                generation.cancel()
+
+    def detach(self):
+        with self._lock:
+            self._generation = None
+
+    def cancel(self, wait_timeout=10):
+        with self._lock:
+            self._cancelled.set()
+            generation = self._generation
+        if generation is None:
+            return True
+        generation.cancel()
+        return generation.wait_stopped(wait_timeout)
@@ -1,14 +1,13 @@
-import os
-from langchain_chroma import Chroma
 from get_embedding_function import get_embedding_function
-from pathlib import Path
+from tracing import span
+from vector_store import search_vectors
 
-def query_rag(query_text: str, vector_database_directory, k_value):
+def embed_query(query_text: str):
     safe_query_text = query_text.replace('{', '{{').replace('}', '}}')
-    embedding_function = get_embedding_function()
-    user_data_dir = Path(os.environ.get('ELECTRON_APP_DATA_DIR', '.'))
-    db_root = user_data_dir / 'storage' / 'db_store'
-    full_db_path = db_root / vector_database_directory
-    db = Chroma(persist_directory=str(full_db_path), embedding_function=embedding_function)
-    results = db.similarity_search_with_score(safe_query_text, k=k_value)
-    return results
+    with span("rag.embed_query"):
+        return get_embedding_function().embed_query(safe_query_text)
+
+def query_rag(query_text: str, vector_database_directory, k_value, query_embedding=None):
+    if query_embedding is None:
+        query_embedding = embed_query(query_text)
+    return search_vectors(vector_database_directory, query_embedding, k_value)
@@ -1,7 +1,10 @@
-from langchain_ollama import ChatOllama
 from prompt_maker import make_prompt
 from uploaded_data import Uploaded_data
-from rag_querying import query_rag
+from rag_querying import query_rag, embed_query
+from context_packer import pack_context, candidates_per_document
+from answer_cache import AnswerCache
+from ollama_stream import OllamaGeneration, GenerationCancelled, GenerationTimeout, CancelToken
+from tracing import span, record, increment
 import glob
 import os
 import time
@@ -10,90 +13,152 @@ import re
 
 
 class Session:
-    def __init__(self, currently_used_data):
+    def __init__(self, currently_used_data, answer_cache=None, session_id="default"):
+        self.session_id = session_id
         self.session_summary = ""
         self.session_history = ""
         self.num_exchanges = 0
         self.currently_used_data = currently_used_data
-        self._cancel_generation = False
+        self._cancel_token = None
         self.ltm_session_history = None
+        self.answer_cache = answer_cache
+        self.last_response_cached = False
 
         try:
-            project_root = Path(__file__).resolve().parents[2]
-            storage_dir = project_root / 'storage' / 'chat_history_storage'
-
-            if os.path.exists(storage_dir):
-                old_files = glob.glob(str(storage_dir / "chat_history_*.txt"))
-
-                for old_file in old_files:
-                    base_name = os.path.basename(old_file)
-                    os.remove(old_file)
-                    Uploaded_data.delete_vector_db(base_name)
-            else:
-                os.makedirs(storage_dir, exist_ok=True)
-
+            self.clear_history_storage(session_id)
         except Exception as e:
             print(f"DEBUG: Error cleaning up chat history storage during initialization: {e}")
 
+    @staticmethod
+    def get_history_root():
+        return Path(os.environ.get('ELECTRON_APP_DATA_DIR', '.')) / 'storage' / 'chat_history_storage'
+
+    @staticmethod
+    def get_history_storage_dir(session_id):
+        safe_session_id = re.sub(r'[^A-Za-z0-9_-]', '_', str(session_id))
+        return Session.get_history_root() / safe_session_id
+
+    @staticmethod
+    def clear_history_storage(session_id):
+        storage_dir = Session.get_history_storage_dir(session_id)
+        if os.path.exists(storage_dir):
+            old_files = glob.glob(str(storage_dir / "chat_history_*.txt"))
+
+            for old_file in old_files:
+                base_name = os.path.basename(old_file)
+                os.remove(old_file)
+                Uploaded_data.delete_vector_db(base_name)
+        else:
+            os.makedirs(storage_dir, exist_ok=True)
+
+    def to_state(self):
+        return {
+            "session_id": self.session_id,
+            "session_summary": self.session_summary,
+            "session_history": self.session_history,
+            "num_exchanges": self.num_exchanges,
+            "selected_names": [data.name for data in self.currently_used_data],
+            "ltm_session_history": self.ltm_session_history
+        }
+
+    @classmethod
+    def from_state(cls, state, currently_used_data, answer_cache=None):
+        session = cls.__new__(cls)
+        session.session_id = state["session_id"]
+        session.session_summary = state["session_summary"]
+        session.session_history = state["session_history"]
+        session.num_exchanges = state["num_exchanges"]
+        session.currently_used_data = currently_used_data
+        session._cancel_token = None
+        session.ltm_session_history = state["ltm_session_history"]
+        session.answer_cache = answer_cache
+        session.last_response_cached = False
+        return session
+
     def add_user_message(self, message):
         self.session_history += f"<|start_header_id|>user<|end_header_id|>\n\n{message}<|eot_id|>"
 
     def add_assistant_message(self, message):
         self.session_history += f"<|start_header_id|>assistant<|end_header_id|>\n{message}<|eot_id|>"
 
-    def ask(self, input):
-        self._cancel_generation = False
-        llm = ChatOllama(model="llama3.2:1b", num_ctx=4000, temperature=0.6, repeat_penalty=1.2)
+    def ask(self, input, first_token_timeout=None, deadline=None, cancel_token=None):
+        cancel_token = cancel_token or CancelToken()
+        self._cancel_token = cancel_token
+        self.last_response_cached = False
+
+        query_embedding = None
+        documents_key = None
+        use_answer_cache = self.answer_cache is not None and self.session_history == "" and self.ltm_session_history is None
+        if use_answer_cache or self.currently_used_data or self.ltm_session_history is not None:
+            query_embedding = embed_query(input)
+
+        if use_answer_cache:
+            try:
+                with span("ask.answer_cache_lookup"):
+                    documents_key = AnswerCache.documents_key(self.currently_used_data)
+                    cached_entry = self.answer_cache.lookup(query_embedding, documents_key)
+            except Exception as e:
+                print(f"DEBUG: Answer cache lookup failed: {e}")
+                use_answer_cache = False
+                cached_entry = None
+
+            if cached_entry is not None:
+                increment("answer_cache.hit")
+                self.last_response_cached = True
+                yield from self._replay_cached_answer(input, cached_entry, cancel_token)
+                return
+            increment("answer_cache.miss")
+
         doc_context = None
         formatted_sources = None
         if self.currently_used_data != []:
             doc_context = ""
-            source_filenames = []
+            source_rows = []
             all_results = []
-            for data in self.currently_used_data:
-                results = query_rag(input, data.vector_database_path, 3)
-                for doc, score in results:
-                    doc.metadata["document_name"] = data.name
-                    all_results.append((doc, score))
-
-            all_results.sort(key=lambda x: x[1])
-
-            top_results = all_results[:5]
-
-            if top_results:
+            budget_tokens = int(os.environ.get('HERMA_CONTEXT_TOKENS', '1500'))
+            with span("ask.retrieval"):
+                for data in self.currently_used_data:
+                    k_value = candidates_per_document(budget_tokens, data.chunk_size, len(self.currently_used_data))
+                    with data.querying():
+                        results = query_rag(input, data.vector_database_path, k_value,
+                                            query_embedding=query_embedding)
+                    for doc, score in results:
+                        doc.metadata["document_name"] = data.name
+                        all_results.append((doc, score))
+
+            with span("ask.context_pack"):
+                packed = pack_context(
+                    all_results,
+                    budget_tokens,
+                    min_similarity=float(os.environ.get('HERMA_CONTEXT_MIN_SIMILARITY', '0.2')),
+                    similarity_margin=float(os.environ.get('HERMA_CONTEXT_SIMILARITY_MARGIN', '0.25'))
+                )
+
+            if packed:
                 context_pieces = []
-                for doc, score in top_results:
-                    doc_name = doc.metadata.get("document_name", "Unknown")
-                    context_piece = f"From document '{doc_name}':\n{doc.page_content}"
-                    context_pieces.append(context_piece)
-
-                    source = doc.metadata.get("id", "").split("/")[-1]
-                    file_parts = source.split(" Page: ")
-                    filename = file_parts[0]
-
-                    page = "-"
-                    section = "-"
-                    if len(file_parts) > 1 and ":" in file_parts[1]:
-                        page_section = file_parts[1].split(":")
-                        page = page_section[0]
-                        section = page_section[1] if len(page_section) > 1 else "-"
-
-                    source_filenames.append((filename, page, section))
+                for piece in packed:
+                    context_pieces.append(f"From document '{piece.document_name}':\n{piece.text}")
+                    row = (piece.filename, piece.page, piece.section)
+                    if row not in source_rows:
+                        source_rows.append(row)
 
                 doc_context = "\n\n---\n\n".join(context_pieces)
 
-            markdown_table = "\n\n**Sources**\n\n| Filename | Page | Section |\n| -------- | ---- | ------- |\n"
-            for filename, page, section in source_filenames:
-                markdown_table += f"| {filename} | {page} | {section} |\n"
+            if source_rows:
+                markdown_table = "\n\n**Sources**\n\n| Filename | Page | Section |\n| -------- | ---- | ------- |\n"
+                for filename, page, section in source_rows:
+                    markdown_table += f"| {filename} | {page} | {section} |\n"
 
-            formatted_sources = markdown_table
+                formatted_sources = markdown_table
 
         chat_history_context = ""
         if self.ltm_session_history is not None:
             chat_history_context = "This conversation has been going on for a while, here is some relevant context from " \
                                    "earlier in the conversation that you no longer remember: "
 
-            history_results = query_rag(input, self.ltm_session_history.vector_database_path, 3)
+            with span("ask.history_retrieval"):
+                history_results = query_rag(input, self.ltm_session_history.vector_database_path, 3,
+                                            query_embedding=query_embedding)
 
             if history_results:
                 history_pieces = []
@@ -104,25 +169,43 @@ class Session:
             else:
                 chat_history_context += "No relevant earlier context found."
 
-        prompt_template = make_prompt(doc_context, self.currently_used_data)
+        with span("ask.prompt_build"):
+            prompt_template = make_prompt(doc_context, self.currently_used_data)
 
-        complete_prompt = prompt_template.format(
-            chat_history=self.session_history,
-            input=input
-        )
+            complete_prompt = prompt_template.format(
+                chat_history=self.session_history,
+                input=input
+            )
 
         content_yielded = False
         accumulated_response = ""
         was_interrupted = False
+        generation_failed = False
+
+        generation = OllamaGeneration(
+            model="llama3.2:1b",
+            prompt=complete_prompt,
+            options={"num_ctx": 4000, "temperature": 0.6, "repeat_penalty": 1.2},
+            first_token_timeout=first_token_timeout or float(os.environ.get('HERMA_FIRST_TOKEN_TIMEOUT', '120')),
+            deadline=deadline or float(os.environ.get('HERMA_GENERATION_DEADLINE', '600'))
+        )
+        cancel_token.attach(generation)
 
+        generation_started = time.perf_counter()
+        first_token_at = None
+        tokens_received = 0
         try:
 
-            for chunk in llm.stream(complete_prompt):
-                if self._cancel_generation:
+            for chunk_content in generation.stream():
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    record("ask.prompt_eval", first_token_at - generation_started)
+                tokens_received += 1
+
+                if cancel_token.cancelled:
                     was_interrupted = True
                     break
 
-                chunk_content = chunk.content
                 chunk_content = re.sub(r'^<\|start_header_id\|>assistant<\|end_header_id\|>\s*', '', chunk_content)
                 chunk_content = re.sub(r'<\|eot_id\|>$', '', chunk_content)
 
@@ -140,19 +223,75 @@ class Session:
 
                 self.add_assistant_message(ai_response)
 
+        except GenerationCancelled:
+            was_interrupted = True
+            if content_yielded:
+                self.add_user_message(input)
+                self.add_assistant_message(accumulated_response + " [User interrupted response]")
+
+        except GenerationTimeout:
+            generation_failed = True
+            if content_yielded:
+                self.add_user_message(input)
+                self.add_assistant_message(accumulated_response + " [Response timed out]")
+            else:
+                raise
+
         except Exception as e:
+            generation_failed = True
             if content_yielded:
                 self.add_user_message(input)
                 self.add_assistant_message(accumulated_response + " [Response interrupted due to error]")
 
+        finally:
+            generation.cancel()
+            cancel_token.detach()
+            if first_token_at is not None:
+                generation_time = time.perf_counter() - first_token_at
+                record("ask.generation", generation_time)
+                if generation_time > 0:
+                    record("ask.tokens_per_s", tokens_received / generation_time)
+
         if not was_interrupted and formatted_sources is not None and content_yielded:
             yield formatted_sources
 
+        if use_answer_cache and content_yielded and not was_interrupted and not generation_failed:
+            try:
+                self.answer_cache.store(input, query_embedding, documents_key, accumulated_response, formatted_sources)
+            except Exception as e:
+                print(f"DEBUG: Answer cache store failed: {e}")
+
         self.num_exchanges += 1
         self.trim_chat_history()
 
-    def cancel_generation(self):
-        self._cancel_generation = True
+    def _replay_cached_answer(self, input, cached_entry, cancel_token):
+        answer = cached_entry["answer"]
+        was_interrupted = False
+        replayed = ""
+
+        for piece in re.findall(r'\S+\s*|\s+', answer):
+            if cancel_token.cancelled:
+                was_interrupted = True
+                break
+            replayed += piece
+            yield piece
+
+        self.add_user_message(input)
+        if was_interrupted:
+            self.add_assistant_message(replayed + " [User interrupted response]")
+        else:
+            self.add_assistant_message(answer)
+            if cached_entry["sources"] is not None:
+                yield cached_entry["sources"]
+
+        self.num_exchanges += 1
+        self.trim_chat_history()
+
+    def cancel_generation(self, wait_timeout=10):
+        cancel_token = self._cancel_token
+        if cancel_token is None:
+            return True
+        return cancel_token.cancel(wait_timeout)
 
 
     def get_history_as_string(self):
@@ -169,6 +308,10 @@ class Session:
         return history_string
 
     def trim_chat_history(self):
+        with span("history.trim"):
+            self._trim_chat_history()
+
+    def _trim_chat_history(self):
 
         history_string = self.get_history_as_string()
         total_length = len(history_string)
@@ -222,7 +365,7 @@ class Session:
         self.session_history = new_history
 
         if clipped_history:
-            storage_dir = Path(os.environ.get('ELECTRON_APP_DATA_DIR', '.')) / 'storage' / 'chat_history_storage'
+            storage_dir = self.get_history_storage_dir(self.session_id)
             os.makedirs(storage_dir, exist_ok=True)
 
             existing_content = ""
@@ -246,7 +389,7 @@ class Session:
                 print(f"DEBUG: Error cleaning up old history files: {e}")
 
             timestamp = int(time.time() * 1000)
-            history_filename = f"chat_history_{timestamp}.txt"
+            history_filename = f"chat_history_{storage_dir.name}_{timestamp}.txt"
             history_filepath = storage_dir / history_filename
 
             with open(history_filepath, 'w', encoding='utf-8') as f:
@@ -0,0 +1,184 @@
+import os
+import re
+import glob
+import time
+import shutil
+import pickle
+import threading
+from collections import OrderedDict
+from session import Session
+from uploaded_data import Uploaded_data
+
+
+DEFAULT_SESSION_ID = "default"
+
+
+class SessionPool:
+    def __init__(self, storage_dir, uploaded_data_store, answer_cache=None, max_live_sessions=8,
+                 idle_timeout=900, max_concurrent_generations=1):
+        self.uploaded_data_store = uploaded_data_store
+        self.answer_cache = answer_cache
+        self.max_live_sessions = max_live_sessions
+        self.idle_timeout = idle_timeout
+        self.evicted_dir = storage_dir / "sessions"
+        self.sessions = OrderedDict()
+        self.last_used = {}
+        self.in_flight = {}
+        self.session_locks = {}
+        self._lock = threading.RLock()
+        self.generation_slots = threading.BoundedSemaphore(max_concurrent_generations)
+        self.waiting_generations = 0
+
+        self._clear_previous_run()
+
+    def _clear_previous_run(self):
+        # Chat history only lives as long as the backend process, same as the
+        # single session used to.
+        try:
+            history_root = Session.get_history_root()
+            for old_file in glob.glob(str(history_root / "**" / "chat_history_*.txt"), recursive=True):
+                os.remove(old_file)
+                Uploaded_data.delete_vector_db(os.path.basename(old_file))
+            if os.path.exists(self.evicted_dir):
+                shutil.rmtree(self.evicted_dir)
+            os.makedirs(self.evicted_dir, exist_ok=True)
+        except Exception as e:
+            print(f"DEBUG: Error cleaning up previous sessions: {e}")
+
+    def _evicted_path(self, session_id):
+        safe_session_id = re.sub(r'[^A-Za-z0-9_-]', '_', str(session_id))
+        return self.evicted_dir / f"{safe_session_id}.pkl"
+
+    def get(self, session_id=None):
+        session_id = session_id or DEFAULT_SESSION_ID
+        with self._lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                session = self._restore(session_id)
+                if session is None:
+                    session = Session(currently_used_data=[], answer_cache=self.answer_cache, session_id=session_id)
+                self.sessions[session_id] = session
+            self.sessions.move_to_end(session_id)
+            self.last_used[session_id] = time.time()
+            self.evict(keep=session_id)
+            return session
+
+    def new_session(self, session_id=None):
+        session_id = session_id or DEFAULT_SESSION_ID
+        with self._lock:
+            self.close(session_id)
+            return self.get(session_id)
+
+    def close(self, session_id):
+        with self._lock:
+            session = self.sessions.pop(session_id, None)
+            self.last_used.pop(session_id, None)
+            if session is not None:
+                session.cancel_generation()
+            evicted_path = self._evicted_path(session_id)
+            if os.path.exists(evicted_path):
+                os.remove(evicted_path)
+            try:
+                Session.clear_history_storage(session_id)
+            except Exception as e:
+                print(f"DEBUG: Error cleaning up history for session {session_id}: {e}")
+
+    def list_sessions(self):
+        with self._lock:
+            live = list(self.sessions.keys())
+            evicted = [os.path.splitext(os.path.basename(path))[0]
+                       for path in glob.glob(str(self.evicted_dir / "*.pkl"))]
+            return live, [session_id for session_id in evicted if session_id not in live]
+
+    def evict(self, keep=None):
+        with self._lock:
+            now = time.time()
+            for session_id in list(self.sessions.keys()):
+                if session_id == keep or self.in_flight.get(session_id):
+                    continue
+                over_capacity = len(self.sessions) > self.max_live_sessions
+                idle = now - self.last_used.get(session_id, now) > self.idle_timeout
+                if not over_capacity and not idle:
+                    continue
+                self._persist(self.sessions[session_id])
+                del self.sessions[session_id]
+                self.last_used.pop(session_id, None)
+
+    def _persist(self, session):
+        evicted_path = self._evicted_path(session.session_id)
+        temp_file = f"{evicted_path}.tmp"
+        with open(temp_file, 'wb') as file:
+            pickle.dump(session.to_state(), file)
+        os.replace(temp_file, evicted_path)
+
+    def _restore(self, session_id):
+        evicted_path = self._evicted_path(session_id)
+        if not os.path.exists(evicted_path):
+            return None
+        try:
+            with open(evicted_path, 'rb') as file:
+                state = pickle.load(file)
+        except (EOFError, pickle.UnpicklingError) as e:
+            print(f"DEBUG: Could not restore session {session_id}: {e}")
+            return None
+        finally:
+            os.remove(evicted_path)
+
+        selected_names = set(state["selected_names"])
+        currently_used_data = [data for data in self.uploaded_data_store.data if data.name in selected_names]
+        return Session.from_state(state, currently_used_data, answer_cache=self.answer_cache)
+
+    def remove_data(self, uploaded_data):
+        with self._lock:
+            for session in self.sessions.values():
+                if uploaded_data in session.currently_used_data:
+                    session.currently_used_data = [data for data in session.currently_used_data
+                                                   if data is not uploaded_data]
+
+    def _session_lock(self, session_id):
+        with self._lock:
+            session_lock = self.session_locks.get(session_id)
+            if session_lock is None:
+                session_lock = self.session_locks[session_id] = threading.Lock()
+            return session_lock
+
+    @staticmethod
+    def _wait_for(lock, cancel_token):
+        # Poll so a request interrupted while queued stops waiting right away.
+        while not lock.acquire(timeout=0.2):
+            if cancel_token is not None and cancel_token.cancelled:
+                return False
+        return True
+
+    def acquire_generation_slot(self, session_id, cancel_token=None):
+        # Chats on one session share its history, so they run one at a time; the
+        # semaphore then caps generations across sessions. Returns False if the
+        # request was cancelled before it got its turn.
+        with self._lock:
+            self.in_flight[session_id] = self.in_flight.get(session_id, 0) + 1
+            self.waiting_generations += 1
+        session_lock = self._session_lock(session_id)
+        has_session_lock = False
+        acquired = False
+        try:
+            has_session_lock = self._wait_for(session_lock, cancel_token)
+            acquired = has_session_lock and self._wait_for(self.generation_slots, cancel_token)
+            return acquired
+        finally:
+            with self._lock:
+                self.waiting_generations -= 1
+            if not acquired:
+                if has_session_lock:
+                    session_lock.release()
+                self._finish_in_flight(session_id)
+
+    def release_generation_slot(self, session_id):
+        self.generation_slots.release()
+        self._session_lock(session_id).release()
+        self._finish_in_flight(session_id)
+
+    def _finish_in_flight(self, session_id):
+        with self._lock:
+            self.in_flight[session_id] -= 1
+            if not self.in_flight[session_id]:
+                del self.in_flight[session_id]
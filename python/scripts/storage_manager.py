@@ -0,0 +1,305 @@
+import os
+import json
+import time
+import shutil
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from flat_index import FLAT_INDEX_SUFFIX
+
+
+class StorageManager:
+    # Keeps an index of every vector collection under storage/db_store so deletes
+    # are exact lookups instead of directory scans, and so orphans and quota
+    # evictions can be found without guessing from directory names.
+    def __init__(self, db_root, index_filename, quota_bytes=0, orphan_grace=3600):
+        self.db_root = Path(db_root)
+        self.index_filename = index_filename
+        self.quota_bytes = quota_bytes
+        self.orphan_grace = orphan_grace
+        self._lock = threading.RLock()
+        self._collection_locks = {}
+        self._users = {}
+        self._stop_event = threading.Event()
+        self._thread = None
+        os.makedirs(str(self.db_root), exist_ok=True)
+        self.collections = self._load()
+
+    def _load(self):
+        try:
+            with open(self.index_filename, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def save(self):
+        with self._lock:
+            temp_file = f"{self.index_filename}.tmp"
+            try:
+                with open(temp_file, 'w', encoding='utf-8') as f:
+                    json.dump(self.collections, f)
+                os.replace(temp_file, self.index_filename)
+            except Exception as e:
+                print(f"Failed to save storage index: {str(e)}")
+
+    def _paths(self, collection):
+        return [self.db_root / collection, self.db_root / f"{collection}{FLAT_INDEX_SUFFIX}"]
+
+    def _size_on_disk(self, collection):
+        size = 0
+        for path in self._paths(collection):
+            if path.is_dir():
+                for root, _, filenames in os.walk(str(path)):
+                    for filename in filenames:
+                        try:
+                            size += os.path.getsize(os.path.join(root, filename))
+                        except OSError:
+                            pass
+            elif path.exists():
+                size += path.stat().st_size
+        return size
+
+    def _delete_files(self, collection):
+        from vector_store import forget_flat_index, release_chroma
+        deleted = True
+        for path in self._paths(collection):
+            if not path.exists():
+                continue
+            try:
+                if path.is_dir():
+                    release_chroma(path)
+                    shutil.rmtree(str(path))
+                else:
+                    forget_flat_index(str(path))
+                    os.remove(str(path))
+            except Exception as e:
+                print(f"Error deleting database {path}: {e}")
+                deleted = False
+        return deleted
+
+    def collection_lock(self, collection):
+        with self._lock:
+            lock = self._collection_locks.get(collection)
+            if lock is None:
+                lock = self._collection_locks[collection] = threading.RLock()
+            return lock
+
+    # A collection is in use while it is being queried, written or synced. Quota
+    # eviction and garbage collection leave it alone until it is released, even
+    # if it has not been registered yet.
+    def acquire(self, collection):
+        with self._lock:
+            self._users[collection] = self._users.get(collection, 0) + 1
+
+    def release(self, collection):
+        with self._lock:
+            self._users[collection] -= 1
+            if not self._users[collection]:
+                del self._users[collection]
+
+    @contextmanager
+    def using(self, collection):
+        self.acquire(collection)
+        try:
+            yield
+        finally:
+            self.release(collection)
+
+    def in_use(self, collection):
+        with self._lock:
+            return collection in self._users
+
+    def register(self, collection, owner, data_path, kind="document"):
+        size = self._size_on_disk(collection)
+        now = time.time()
+        with self._lock:
+            entry = self.collections.get(collection)
+            self.collections[collection] = {
+                "owner": owner,
+                "data_path": data_path,
+                "kind": kind,
+                "size": size,
+                "created": entry["created"] if entry else now,
+                "last_used": now,
+                "evicted": False
+            }
+            self.save()
+        self.enforce_quota(protected={collection})
+
+    def adopt(self, uploaded_data):
+        # Collections written before the index existed.
+        with self._lock:
+            known = uploaded_data.vector_database_path in self.collections
+        if not known and any(path.exists() for path in self._paths(uploaded_data.vector_database_path)):
+            self.register(uploaded_data.vector_database_path, uploaded_data.name, uploaded_data.data_path)
+
+    def touch(self, collection):
+        with self._lock:
+            entry = self.collections.get(collection)
+            if entry is not None:
+                entry["last_used"] = time.time()
+
+    def is_evicted(self, collection):
+        with self._lock:
+            entry = self.collections.get(collection)
+            return entry is not None and entry["evicted"]
+
+    def discard_partial(self, collection):
+        # A failed ingestion leaves whatever was written so far; a collection that
+        # was being re-indexed stays evicted so the next query tries again.
+        self._delete_files(collection)
+        with self._lock:
+            entry = self.collections.get(collection)
+            if entry is not None:
+                entry["evicted"] = True
+                entry["size"] = 0
+                self.save()
+
+    def remove(self, collection):
+        with self._lock:
+            self._delete_files(collection)
+            self.collections.pop(collection, None)
+            self._collection_locks.pop(collection, None)
+            self.save()
+
+    def remove_owner(self, owner):
+        with self._lock:
+            collections = [name for name, entry in self.collections.items() if entry["owner"] == owner]
+        for collection in collections:
+            self.remove(collection)
+
+    def evict(self, collection):
+        # Collections that are in use or being re-indexed are skipped rather than
+        # waited for: users register under the collection lock, and two threads
+        # re-indexing different collections must not wait on each other.
+        lock = self.collection_lock(collection)
+        if not lock.acquire(blocking=False):
+            return False
+        try:
+            if self.in_use(collection):
+                return False
+            if not self._delete_files(collection):
+                return False
+            with self._lock:
+                entry = self.collections.get(collection)
+                if entry is not None:
+                    entry["evicted"] = True
+                    entry["size"] = 0
+                    self.save()
+        finally:
+            lock.release()
+        print(f"Evicted vector store {collection} to stay under the storage quota")
+        return True
+
+    def enforce_quota(self, protected=()):
+        if not self.quota_bytes:
+            return
+        with self._lock:
+            total = sum(entry["size"] for entry in self.collections.values())
+            candidates = sorted(
+                (entry["last_used"], name) for name, entry in self.collections.items()
+                if not entry["evicted"] and entry["kind"] == "document" and name not in protected
+                and entry["data_path"] and os.path.exists(entry["data_path"])
+            )
+        for _, collection in candidates:
+            if total <= self.quota_bytes:
+                break
+            with self._lock:
+                size = self.collections[collection]["size"]
+            if self.evict(collection):
+                total -= size
+
+    def collect_garbage(self, referenced):
+        now = time.time()
+        with self._lock:
+            indexed = dict(self.collections)
+
+        orphans = []
+        for name, entry in indexed.items():
+            if now - entry["created"] < self.orphan_grace:
+                continue
+            if entry["kind"] == "document" and name not in referenced:
+                orphans.append(name)
+            elif entry["kind"] == "history" and not os.path.exists(entry["data_path"]):
+                orphans.append(name)
+
+        # Directories nobody registered come from uploads that failed or were
+        # interrupted before ingestion finished.
+        for filename in os.listdir(str(self.db_root)):
+            name = filename[:-len(FLAT_INDEX_SUFFIX)] if filename.endswith(FLAT_INDEX_SUFFIX) else filename
+            if name in indexed or name in referenced:
+                continue
+            try:
+                age = now - os.path.getmtime(str(self.db_root / filename))
+            except OSError:
+                continue
+            if age >= self.orphan_grace:
+                orphans.append(name)
+
+        removed = 0
+        for name in set(orphans):
+            # Long ingestions only register once they finish, and acquire() takes
+            # the same lock, so a store still being written is never swept.
+            with self._lock:
+                if name in self._users:
+                    continue
+                print(f"Removing orphaned vector store {name}")
+                self.remove(name)
+            removed += 1
+        return removed
+
+    def usage(self):
+        with self._lock:
+            collections = [
+                {
+                    "name": name,
+                    "owner": entry["owner"],
+                    "kind": entry["kind"],
+                    "size": entry["size"],
+                    "lastUsed": entry["last_used"],
+                    "evicted": entry["evicted"]
+                }
+                for name, entry in self.collections.items()
+            ]
+        collections.sort(key=lambda c: c["size"], reverse=True)
+        return {
+            "totalBytes": sum(c["size"] for c in collections),
+            "quotaBytes": self.quota_bytes,
+            "collections": collections
+        }
+
+    def start(self, get_referenced, interval=600):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, args=(get_referenced, interval), daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self.save()
+
+    def _run(self, get_referenced, interval):
+        while not self._stop_event.wait(interval):
+            try:
+                self.collect_garbage(get_referenced())
+                self.enforce_quota()
+                self.save()
+            except Exception as e:
+                print(f"Error collecting vector storage: {e}")
+
+
+_storage_manager = None
+_storage_manager_lock = threading.Lock()
+
+
+def get_storage_manager():
+    global _storage_manager
+    with _storage_manager_lock:
+        if _storage_manager is None:
+            storage_dir = Path(os.environ.get('ELECTRON_APP_DATA_DIR', '.')) / 'storage'
+            _storage_manager = StorageManager(
+                storage_dir / 'db_store',
+                str(storage_dir / 'db_store_index.json'),
+                quota_bytes=int(float(os.environ.get('HERMA_STORAGE_QUOTA_MB', '0')) * 1024 * 1024),
+                orphan_grace=float(os.environ.get('HERMA_STORAGE_ORPHAN_GRACE', '3600'))
+            )
+        return _storage_manager
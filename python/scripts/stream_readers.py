@@ -0,0 +1,192 @@
+import csv
+import json
+import codecs
+import chardet
+
+ENCODING_SAMPLE_SIZE = 64 * 1024
+JSON_READ_SIZE = 64 * 1024
+
+
+def detect_encoding(path, sample_size=ENCODING_SAMPLE_SIZE):
+    with open(path, "rb") as f:
+        sample = f.read(sample_size)
+
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+
+    try:
+        sample.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError as e:
+        # A full sample may end in the middle of a multi-byte character.
+        if len(sample) == sample_size and e.start >= len(sample) - 3:
+            return "utf-8"
+
+    encoding = chardet.detect(sample).get("encoding")
+    if not encoding or encoding.lower() == "ascii":
+        return "utf-8"
+    try:
+        codecs.lookup(encoding)
+    except LookupError:
+        return "utf-8"
+    return encoding
+
+
+def iter_csv_row_groups(path, rows_per_group):
+    encoding = detect_encoding(path)
+    with open(path, "r", encoding=encoding, errors="replace", newline="") as f:
+        sample = f.read(4096)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
+        except csv.Error:
+            dialect = csv.excel
+
+        reader = csv.reader(f, dialect)
+        header = None
+        group = []
+        group_start = None
+        for row in reader:
+            if not any(cell.strip() for cell in row):
+                continue
+            if header is None:
+                header = row
+                continue
+            if not group:
+                group_start = reader.line_num
+            group.append(row)
+            if len(group) >= rows_per_group:
+                yield header, group, group_start, reader.line_num
+                group = []
+
+        if group:
+            yield header, group, group_start, reader.line_num
+        elif header is not None and group_start is None:
+            yield header, [], 1, 1
+
+
+class _JsonTextStream:
+    def __init__(self, f):
+        self.f = f
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _read_more(self, size=JSON_READ_SIZE):
+        if self.eof:
+            return False
+        data = self.f.read(size)
+        if not data:
+            self.eof = True
+            return False
+        if self.pos > JSON_READ_SIZE:
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+        self.buffer += data
+        return True
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._read_more():
+                return ""
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected '{char}' at offset {self.pos} in JSON stream")
+        self.pos += 1
+
+    def decode_value(self):
+        self.peek()
+        read_size = JSON_READ_SIZE
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # A number at the very end of the buffer may continue in the next read.
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            if not self._read_more(read_size):
+                continue
+            read_size *= 2
+
+    def iter_array(self):
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.decode_value()
+            char = self.peek()
+            self.pos += 1
+            if char == "]":
+                return
+            if char != ",":
+                raise ValueError(f"Malformed JSON array near offset {self.pos}")
+
+    def iter_object(self):
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.decode_value()
+            self.expect(":")
+            yield key
+            char = self.peek()
+            self.pos += 1
+            if char == "}":
+                return
+            if char != ",":
+                raise ValueError(f"Malformed JSON object near offset {self.pos}")
+
+
+def _is_json_lines(path, encoding):
+    with open(path, "r", encoding=encoding, errors="replace") as f:
+        first_line = f.readline(1024 * 1024)
+        if not first_line.endswith("\n"):
+            return False
+        try:
+            json.loads(first_line)
+        except ValueError:
+            return False
+        return bool(f.read(4096).strip())
+
+
+# Top-level arrays are streamed element by element. For a top-level object each
+# member is a record, and members holding arrays are streamed as well. Files
+# with one JSON value per line are read line by line.
+def iter_json_records(path):
+    encoding = detect_encoding(path)
+
+    if _is_json_lines(path, encoding):
+        with open(path, "r", encoding=encoding, errors="replace") as f:
+            for line_number, line in enumerate(f, start=1):
+                if line.strip():
+                    yield f"line {line_number}", json.loads(line)
+        return
+
+    with open(path, "r", encoding=encoding, errors="replace") as f:
+        stream = _JsonTextStream(f)
+        first = stream.peek()
+        if first == "[":
+            for index, record in enumerate(stream.iter_array()):
+                yield f"[{index}]", record
+        elif first == "{":
+            for key in stream.iter_object():
+                if stream.peek() == "[":
+                    for index, record in enumerate(stream.iter_array()):
+                        yield f"{key}[{index}]", record
+                else:
+                    yield key, stream.decode_value()
+        elif first:
+            yield "value", stream.decode_value()
@@ -0,0 +1,148 @@
+import os
+import time
+import threading
+from collections import deque
+
+METRICS_ENABLED = os.environ.get('HERMA_METRICS', '1').lower() not in ('0', 'false', 'no')
+HISTOGRAM_SIZE = 512
+
+_local = threading.local()
+
+
+class Metrics:
+    def __init__(self, histogram_size=HISTOGRAM_SIZE):
+        self.histogram_size = histogram_size
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, value):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = deque(maxlen=self.histogram_size)
+            histogram.append(value)
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def register_gauge(self, name, read_value):
+        self.gauges[name] = read_value
+
+    def snapshot(self):
+        with self._lock:
+            histograms = {name: list(values) for name, values in self.histograms.items()}
+            counters = dict(self.counters)
+
+        summary = {}
+        for name, values in histograms.items():
+            if not values:
+                continue
+            values.sort()
+            summary[name] = {
+                "count": len(values),
+                "mean": sum(values) / len(values),
+                "p50": values[len(values) // 2],
+                "p90": values[min(len(values) - 1, int(len(values) * 0.9))],
+                "p99": values[min(len(values) - 1, int(len(values) * 0.99))],
+                "max": values[-1]
+            }
+
+        hit_rates = {}
+        for name, hits in counters.items():
+            if name.endswith(".hit"):
+                prefix = name[:-len(".hit")]
+                total = hits + counters.get(f"{prefix}.miss", 0)
+                hit_rates[prefix] = hits / total if total else 0.0
+
+        gauges = {}
+        for name, read_value in list(self.gauges.items()):
+            try:
+                gauges[name] = read_value()
+            except Exception as e:
+                gauges[name] = f"unavailable: {e}"
+
+        return {
+            "histograms": summary,
+            "counters": counters,
+            "hitRates": hit_rates,
+            "gauges": gauges
+        }
+
+
+metrics = Metrics()
+
+
+class RequestTrace:
+    def __init__(self, emit=None):
+        self.emit = emit
+        self.timings = []
+
+    def add(self, name, duration):
+        timing = {"stage": name, "ms": round(duration * 1000, 3)}
+        self.timings.append(timing)
+        if self.emit is not None:
+            self.emit(timing)
+
+
+def start_trace(emit=None):
+    trace = RequestTrace(emit)
+    _local.trace = trace
+    return trace
+
+
+def end_trace():
+    trace = getattr(_local, 'trace', None)
+    _local.trace = None
+    return trace
+
+
+def current_trace():
+    return getattr(_local, 'trace', None)
+
+
+def record(name, duration):
+    if METRICS_ENABLED:
+        metrics.observe(name, duration)
+    trace = getattr(_local, 'trace', None)
+    if trace is not None:
+        trace.add(name, duration)
+
+
+def increment(name, amount=1):
+    if METRICS_ENABLED:
+        metrics.increment(name, amount)
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def span(name):
+    if not METRICS_ENABLED and getattr(_local, 'trace', None) is None:
+        return _NULL_SPAN
+    return _Span(name)
@@ -1,33 +1,65 @@
 import os
+import json
+import hashlib
 import openpyxl
 import fitz
-import aiofiles
-import chardet
 
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain.schema.document import Document
-from get_embedding_function import get_embedding_function
-from langchain_chroma import Chroma
-from concurrent.futures import ThreadPoolExecutor
+from vector_store import VectorStoreWriter
+from storage_manager import get_storage_manager
+from ingest_workers import get_ingestion_pool
 from docx import Document as DocxDocument
+from docx.table import Table
+from docx.text.paragraph import Paragraph
 from pptx import Presentation
 from pathlib import Path
+from collections import deque
+from contextlib import contextmanager
+from stream_readers import iter_csv_row_groups, iter_json_records
+from tracing import span, record, increment
+from context_packer import estimate_tokens
+from ingest_checkpoint import IngestCheckpoint
+from get_embedding_function import get_embedding_id
 import time
 
+EMBEDDING_BATCH_SIZE = 64
+EXCEL_ROWS_PER_BLOCK = 50
+CSV_ROWS_PER_BLOCK = 50
+JSON_RECORDS_PER_BLOCK = 20
+SUPPORTED_EXTENSIONS = (".pdf", ".txt", ".md", ".docx", ".pptx", ".xlsx", ".csv", ".json")
+
 class Uploaded_data:
-    def __init__(self, name, data_path, non_chat_history, chunk_size):
+    def __init__(self, name, data_path, non_chat_history, chunk_size, ingest=True):
         self.non_chat_history = non_chat_history
         self.name = name
         self.chunk_size = chunk_size
         self.data_path = data_path
-        self.documents = self.load_documents(self.data_path)
         self.timestamp = int(time.time() * 1000)
         self.vector_database_path = f"{name}_{self.timestamp}"
 
-        self.add_to_chroma()
+        checkpoint = None
+        if non_chat_history and ingest:
+            checkpoint, _ = IngestCheckpoint.find(data_path, chunk_size, get_embedding_id())
+            if checkpoint is not None:
+                # Retrying an interrupted upload continues its half-written store.
+                self.timestamp = checkpoint.timestamp
+                self.vector_database_path = checkpoint.vector_database_path
+
+        # Batch uploads run ingestion themselves, across many files at once.
+        if not ingest:
+            return
+
+        try:
+            with span("ingest.total"):
+                summary_chunks = self.add_to_chroma()
+        finally:
+            if checkpoint is not None:
+                checkpoint.release()
 
         if non_chat_history:
-            self.data_summary = self.generate_summary()
+            with span("ingest.summary"):
+                self.data_summary = self.generate_summary(summary_chunks)
 
 
 
@@ -36,7 +68,7 @@ class Uploaded_data:
         if not os.path.exists(data_path):
             raise FileNotFoundError(f"File not found: {data_path}")
         if os.path.isdir(data_path):
-            raise FileNotFoundError("Directory loading not supported. Provide a single file.")
+            raise FileNotFoundError("Directory loading not supported. Provide a single file or use watch_folder.")
         elif data_path.lower().endswith(".pdf"):
             return self._process_pdf(data_path)
         elif data_path.lower().endswith((".txt", ".md")):
@@ -158,16 +190,34 @@ class Uploaded_data:
 
         return '\n'.join(markdown_lines)
 
-    def split_documents(self):
+    def extract_chunks(self, data_path):
+        pool = get_ingestion_pool()
+        if pool is not None:
+            return pool.iter_chunks(data_path, self.chunk_size)
+        return self.iter_chunks(self.load_documents(data_path))
+
+    def iter_chunks(self, documents):
         text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=self.chunk_size,
             chunk_overlap=50,
             length_function=len,
             is_separator_regex=False,
         )
-        with ThreadPoolExecutor() as executor:
-            results = list(executor.map(text_splitter.split_documents, [self.documents]))
-            return [chunk for sublist in results for chunk in sublist]
+        last_page_id = None
+        current_chunk_index = 0
+        for document in documents:
+            for chunk in text_splitter.split_documents([document]):
+                source = chunk.metadata.get("source", "unknown")
+                page = chunk.metadata.get("page", 0)
+                current_page_id = f"{source} Page: {page}"
+                if current_page_id == last_page_id:
+                    current_chunk_index += 1
+                else:
+                    current_chunk_index = 0
+                chunk.metadata["id"] = f"{current_page_id}:{current_chunk_index}"
+                chunk.metadata["tokens"] = estimate_tokens(chunk.page_content)
+                last_page_id = current_page_id
+                yield chunk
 
     def _process_text(self, text_path):
         with open(text_path, "r", encoding="utf-8") as f:
@@ -177,118 +227,306 @@ class Uploaded_data:
     def _process_word(self, word_path):
         try:
             doc = DocxDocument(word_path)
-            text = "\n".join([p.text for p in doc.paragraphs])
-            return [Document(page_content=text, metadata={"source": word_path})]
         except Exception as e:
             raise RuntimeError(f"Failed to process Word document {word_path}: {e}")
+        return self._iter_word_sections(word_path, doc)
+
+    def _iter_word_sections(self, word_path, doc):
+        # One unit per heading-delimited section, with tables kept in place.
+        section_number = 1
+        title = None
+        parts = []
+        for element in doc.element.body.iterchildren():
+            if element.tag.endswith('}p'):
+                paragraph = Paragraph(element, doc)
+                text = paragraph.text.strip()
+                if not text:
+                    continue
+                style_name = paragraph.style.name if paragraph.style is not None else ""
+                if style_name.startswith(("Heading", "Title")):
+                    if parts:
+                        yield self._unit_document(word_path, f"section {section_number}", title, parts)
+                        section_number += 1
+                        parts = []
+                    title = text
+                parts.append(text)
+            elif element.tag.endswith('}tbl'):
+                table = Table(element, doc)
+                rows = [[self._cell_text(cell.text) for cell in row.cells] for row in table.rows]
+                if rows:
+                    parts.append(self._convert_to_markdown_table(rows))
+
+        if parts:
+            yield self._unit_document(word_path, f"section {section_number}", title, parts)
 
     def _process_pptx(self, pptx_path):
         try:
             prs = Presentation(pptx_path)
-            text = "\n".join([shape.text for slide in prs.slides for shape in slide.shapes if hasattr(shape, "text")])
-            return [Document(page_content=text, metadata={"source": pptx_path})]
         except Exception as e:
             raise RuntimeError(f"Failed to process PowerPoint file {pptx_path}: {e}")
+        return self._iter_slides(pptx_path, prs)
+
+    def _iter_slides(self, pptx_path, prs):
+        for slide_number, slide in enumerate(prs.slides, start=1):
+            parts = self._shape_texts(slide.shapes)
+            if slide.has_notes_slide:
+                notes = slide.notes_slide.notes_text_frame.text.strip() if slide.notes_slide.notes_text_frame else ""
+                if notes:
+                    parts.append(f"Notes: {notes}")
+            if not parts:
+                continue
+            title_shape = slide.shapes.title
+            title = title_shape.text.strip() if title_shape is not None and title_shape.has_text_frame else None
+            yield self._unit_document(pptx_path, f"slide {slide_number}", title, parts)
+
+    def _shape_texts(self, shapes):
+        parts = []
+        for shape in shapes:
+            if hasattr(shape, "shapes"):
+                parts.extend(self._shape_texts(shape.shapes))
+            elif shape.has_table:
+                rows = [[self._cell_text(cell.text) for cell in row.cells] for row in shape.table.rows]
+                if rows:
+                    parts.append(self._convert_to_markdown_table(rows))
+            elif shape.has_text_frame and shape.text_frame.text.strip():
+                parts.append(shape.text_frame.text.strip())
+        return parts
+
+    @staticmethod
+    def _cell_text(text):
+        return " ".join(text.split()).replace("|", "\\|")
+
+    @staticmethod
+    def _unit_document(source, page, title, parts):
+        text = "\n\n".join(parts)
+        # The unit hash lets watched folders keep the vectors of slides and
+        # sections that did not change when a file is edited.
+        metadata = {
+            "source": source,
+            "page": page,
+            "unit_hash": hashlib.sha1(text.encode("utf-8")).hexdigest()
+        }
+        if title:
+            metadata["section_title"] = title
+        return Document(page_content=text, metadata=metadata)
 
     def _process_excel(self, excel_path):
         try:
-            wb = openpyxl.load_workbook(excel_path)
-            text = "\n".join(
-                ["\t".join([str(cell.value) for cell in row]) for sheet in wb for row in sheet.iter_rows()])
-            return [Document(page_content=text, metadata={"source": excel_path})]
+            wb = openpyxl.load_workbook(excel_path, read_only=True, data_only=True)
+        except Exception as e:
+            raise RuntimeError(f"Failed to process Excel file {excel_path}: {e}")
+
+        try:
+            for sheet in wb.worksheets:
+                header = None
+                block = []
+                block_start = None
+                blocks_emitted = 0
+
+                for row_number, row in enumerate(sheet.iter_rows(values_only=True), start=1):
+                    cells = ["" if value is None else str(value) for value in row]
+                    while cells and cells[-1] == "":
+                        cells.pop()
+                    if not cells:
+                        continue
+
+                    if header is None:
+                        header = cells
+                        header_row = row_number
+                        continue
+
+                    if not block:
+                        block_start = row_number
+                    block.append(cells)
+
+                    if len(block) >= EXCEL_ROWS_PER_BLOCK:
+                        yield self._excel_block_document(excel_path, sheet.title, header, block, block_start, row_number)
+                        blocks_emitted += 1
+                        block = []
+
+                if block:
+                    yield self._excel_block_document(excel_path, sheet.title, header, block, block_start,
+                                                     block_start + len(block) - 1)
+                elif header is not None and blocks_emitted == 0:
+                    yield self._excel_block_document(excel_path, sheet.title, header, [], header_row, header_row)
+        except RuntimeError:
+            raise
         except Exception as e:
             raise RuntimeError(f"Failed to process Excel file {excel_path}: {e}")
+        finally:
+            wb.close()
+
+    def _excel_block_document(self, excel_path, sheet_name, header, rows, row_start, row_end):
+        # The header is repeated in every block so each chunk can be read on its own.
+        text = "\n".join("\t".join(cells) for cells in [header] + rows)
+        return Document(page_content=f"Sheet: {sheet_name}\n{text}", metadata={
+            "source": excel_path,
+            "page": f"{sheet_name} rows {row_start}-{row_end}",
+            "sheet": sheet_name,
+            "row_start": row_start,
+            "row_end": row_end
+        })
+
+    def _process_csv(self, csv_path):
+        try:
+            for header, rows, line_start, line_end in iter_csv_row_groups(csv_path, CSV_ROWS_PER_BLOCK):
+                text = "\n".join("\t".join(cells) for cells in [header] + rows)
+                yield Document(page_content=text, metadata={
+                    "source": csv_path,
+                    "page": f"rows {line_start}-{line_end}",
+                    "row_start": line_start,
+                    "row_end": line_end
+                })
+        except Exception as e:
+            raise RuntimeError(f"Failed to process CSV file {csv_path}: {e}")
 
-    async def _process_csv(self, csv_path):
-        with open(csv_path, "rb") as f:
-            raw_data = f.read()
-            result = chardet.detect(raw_data)
-            encoding = result["encoding"]
-        if encoding != "utf-8":
-            encoding = "utf-8"
-        async with aiofiles.open(csv_path, "r", encoding=encoding, errors="replace") as f:
-            text = await f.read()
-        return [Document(page_content=text, metadata={"source": csv_path})]
-
-    async def _process_json(self, json_path):
-        async with aiofiles.open(json_path, "r", encoding="utf-8") as f:
-            text = await f.read()
-        return [Document(page_content=text, metadata={"source": json_path})]
+    def _process_json(self, json_path):
+        try:
+            group = []
+            group_start = 0
+            for record_index, (location, record) in enumerate(iter_json_records(json_path)):
+                if not group:
+                    group_start = record_index
+                group.append(f"{location}: {json.dumps(record, ensure_ascii=False)}")
+                if len(group) >= JSON_RECORDS_PER_BLOCK:
+                    yield self._json_block_document(json_path, group, group_start)
+                    group = []
+            if group:
+                yield self._json_block_document(json_path, group, group_start)
+        except Exception as e:
+            raise RuntimeError(f"Failed to process JSON file {json_path}: {e}")
+
+    def _json_block_document(self, json_path, group, group_start):
+        group_end = group_start + len(group) - 1
+        return Document(page_content="\n".join(group), metadata={
+            "source": json_path,
+            "page": f"records {group_start + 1}-{group_end + 1}",
+            "record_start": group_start + 1,
+            "record_end": group_end + 1
+        })
 
     def add_to_chroma(self):
+        # Uploads are checkpointed after every durable batch so an interrupted
+        # ingestion resumes instead of starting over. Chat history is too small
+        # to be worth it.
+        checkpoint = None
+        if self.non_chat_history:
+            checkpoint = IngestCheckpoint.open(self, get_embedding_id())
+            checkpoint.save()
+        resume_from = checkpoint.chunks_committed if checkpoint is not None else 0
+        get_storage_manager().acquire(self.vector_database_path)
         try:
-            print(f"Starting add_to_chroma for {self.name}")
-            chunks = self.split_documents()
-            print(f"Split documents into {len(chunks)} chunks")
-
-            db_path = self.get_db_path()
-            print(f"Got DB path: {db_path}, exists: {os.path.exists(str(db_path))}")
-
-            # Double check directory creation
-            os.makedirs(str(db_path), exist_ok=True)
-            print(f"Created directory, exists now: {os.path.exists(str(db_path))}")
-
-            # Try with a temporary directory if needed
-            if not os.path.exists(str(db_path)):
-                import tempfile
-                temp_dir = tempfile.mkdtemp()
-                print(f"Using temporary directory as fallback: {temp_dir}")
-                db_path = temp_dir
-
-            print(f"Initializing Chroma with path: {db_path}")
-            db = Chroma(
-                persist_directory=str(db_path),
-                embedding_function=get_embedding_function()
-            )
-
-            chunks_with_ids = self.calculate_chunk_ids(chunks)
-            print(f"Calculated chunk IDs")
-
-            existing_items = db.get(include=[])
-            existing_ids = set(existing_items["ids"])
-            print(f"Got {len(existing_ids)} existing items")
-
-            new_chunks = chunks_with_ids
-            new_chunk_ids = [chunk.metadata["id"] for chunk in new_chunks]
-            print(f"Adding {len(new_chunks)} new chunks")
-
-            db.add_documents(new_chunks, ids=new_chunk_ids)
-            print(f"Successfully added documents to Chroma")
+            with span("ingest.open_store"):
+                writer = VectorStoreWriter(self.vector_database_path, resume=resume_from > 0)
+            if resume_from:
+                print(f"Resuming ingestion of {self.name} after {resume_from} chunks")
+
+            # Documents are extracted, split and embedded in fixed-size batches so
+            # large files never have to be held in memory as a whole.
+            head_chunks = []
+            tail_chunks = deque(maxlen=3)
+            total_chunks = 0
+            batch = []
+            extract_time = 0.0
+            chunks = self.extract_chunks(self.data_path)
+            while True:
+                started = time.perf_counter()
+                chunk = next(chunks, None)
+                extract_time += time.perf_counter() - started
+                if chunk is None:
+                    break
+
+                if len(head_chunks) < 6:
+                    head_chunks.append(chunk)
+                tail_chunks.append(chunk)
+                total_chunks += 1
+                if total_chunks == resume_from and chunk.metadata["id"] != checkpoint.last_chunk_id:
+                    # The file no longer splits the way it did when the checkpoint
+                    # was written, so chunks stored under the same ids may hold
+                    # different text. Start over instead of trusting them.
+                    print(f"Chunk stream of {self.name} changed since the checkpoint, re-indexing from the start")
+                    chunks.close()
+                    writer.clear()
+                    checkpoint.restart()
+                    resume_from = 0
+                    head_chunks = []
+                    tail_chunks.clear()
+                    total_chunks = 0
+                    batch = []
+                    chunks = self.extract_chunks(self.data_path)
+                    continue
+
+                batch.append(chunk)
+                if len(batch) >= EMBEDDING_BATCH_SIZE or total_chunks == resume_from:
+                    self._write_batch(writer, batch, total_chunks <= resume_from)
+                    if checkpoint is not None and writer.persisted and total_chunks > resume_from:
+                        checkpoint.commit(total_chunks, chunk.metadata["id"])
+                    batch = []
+
+            if batch:
+                self._write_batch(writer, batch, False)
+            writer.close()
+            record("ingest.extract_split", extract_time)
+            increment("ingest.chunks", total_chunks)
+            get_storage_manager().register(self.vector_database_path, self.name, self.data_path,
+                                           "document" if self.non_chat_history else "history")
+            if checkpoint is not None:
+                checkpoint.delete()
+
+            if total_chunks < 6:
+                return head_chunks
+            return head_chunks[:3] + list(tail_chunks)
         except Exception as e:
             print(f"Error in add_to_chroma: {str(e)}")
             import traceback
             traceback.print_exc()
+            if checkpoint is not None and checkpoint.chunks_committed > 0 and checkpoint.record_failure():
+                print(f"Kept {checkpoint.chunks_committed} indexed chunks of {self.name} to resume later")
+            else:
+                if checkpoint is not None:
+                    checkpoint.delete()
+                get_storage_manager().discard_partial(self.vector_database_path)
             raise
+        finally:
+            get_storage_manager().release(self.vector_database_path)
+            if checkpoint is not None:
+                checkpoint.release()
 
-    def calculate_chunk_ids(self, chunks):
-        last_page_id = None
-        current_chunk_index = 0
-        for chunk in chunks:
-            source = chunk.metadata.get("source", "unknown")
-            page = chunk.metadata.get("page", 0)
-            current_page_id = f"{source} Page: {page}"
-            if current_page_id == last_page_id:
-                current_chunk_index += 1
+    @staticmethod
+    def _write_batch(writer, batch, already_committed):
+        with span("ingest.embed_batch"):
+            if already_committed:
+                # Written before the interruption: only embed what the store lacks.
+                writer.add_missing(batch)
             else:
-                current_chunk_index = 0
-            chunk_id = f"{current_page_id}:{current_chunk_index}"
-            last_page_id = current_page_id
-            chunk.metadata["id"] = chunk_id
+                writer.add(batch)
 
-        return chunks
+    def reindex(self):
+        self.add_to_chroma()
 
-    def generate_summary(self):
+    @contextmanager
+    def querying(self):
+        # Collections evicted to stay under the storage quota are rebuilt from the
+        # source file the first time they are queried again. The collection is
+        # in use until the block exits, so it cannot be evicted mid-query.
+        storage = get_storage_manager()
+        with storage.collection_lock(self.vector_database_path):
+            if storage.is_evicted(self.vector_database_path):
+                print(f"Re-indexing evicted vector store for {self.name}")
+                with span("ingest.reindex"):
+                    self.reindex()
+            storage.acquire(self.vector_database_path)
+        try:
+            storage.touch(self.vector_database_path)
+            yield
+        finally:
+            storage.release(self.vector_database_path)
+
+    def generate_summary(self, sample_chunks):
         from langchain_ollama import ChatOllama
-        chunks = self.split_documents()
-        if not chunks:
+        if not sample_chunks:
             return "No content available for summarization."
-        sample_chunks = []
-        is_full_document = len(chunks) < 6
-        if not is_full_document:
-            sample_chunks = chunks[:3] + chunks[-3:]
-
-        else:
-            sample_chunks = chunks
+        is_full_document = len(sample_chunks) < 6
         sample_text = "\n\n---\n\n".join([chunk.page_content for chunk in sample_chunks])
         if is_full_document:
             summary_prompt = f"""
@@ -338,28 +576,4 @@ class Uploaded_data:
 
     @staticmethod
     def delete_vector_db(filename):
-        db_root = Uploaded_data.get_project_root() / 'storage' / 'db_store'
-
-        # Ensure the directory exists
-        os.makedirs(str(db_root), exist_ok=True)
-
-        # Check if directory exists before trying to list it
-        if not os.path.exists(str(db_root)):
-            print(f"Database root directory does not exist: {db_root}")
-            return
-
-        try:
-            matching_dbs = [d for d in os.listdir(str(db_root))
-                            if d.startswith(filename + "_") or d == filename]
-
-            for db_name in matching_dbs:
-                db_path = db_root / db_name
-                if os.path.exists(str(db_path)):
-                    try:
-                        import shutil
-                        shutil.rmtree(str(db_path))
-                    except Exception as e:
-                        print(f"Error deleting database {db_path}: {e}")
-        except Exception as e:
-            print(f"Error listing database directory {db_root}: {e}")
-
+        get_storage_manager().remove_owner(filename)
@@ -0,0 +1,195 @@
+import os
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from langchain_chroma import Chroma
+from get_embedding_function import get_embedding_function, get_embedding_id
+from flat_index import FlatIndex, FLAT_INDEX_SUFFIX
+from tracing import span
+
+FLAT_INDEX_CACHE_SIZE = 32
+
+# Collections created before embedding backends were recorded were always
+# embedded by Ollama's all-minilm.
+LEGACY_EMBEDDING_ID = "ollama:all-minilm"
+
+
+class EmbeddingMismatchError(ValueError):
+    pass
+
+
+def open_chroma(persist_directory):
+    embedding_id = get_embedding_id()
+    db = Chroma(persist_directory=str(persist_directory), embedding_function=get_embedding_function())
+
+    collection = db._collection
+    metadata = collection.metadata or {}
+    stored_id = metadata.get("embedding_id")
+    if stored_id is None:
+        if collection.count() == 0:
+            collection.modify(metadata={**metadata, "embedding_id": embedding_id})
+            return db
+        stored_id = LEGACY_EMBEDDING_ID
+
+    if stored_id != embedding_id:
+        raise EmbeddingMismatchError(
+            f"Vector store {persist_directory} was built with {stored_id} embeddings but the current backend "
+            f"is {embedding_id}. Re-upload the file or switch HERMA_EMBEDDING_BACKEND back."
+        )
+    return db
+
+
+def release_chroma(persist_directory):
+    # chromadb keeps one shared system per persist directory for the life of the
+    # process. It has to be dropped before the directory is deleted, or a store
+    # rebuilt at the same path is written through the stale, read-only handle.
+    from chromadb.api.shared_system_client import SharedSystemClient
+    target = os.path.abspath(str(persist_directory))
+    systems = []
+    with SharedSystemClient._refcount_lock:
+        for identifier in list(SharedSystemClient._identifier_to_system):
+            if identifier and os.path.abspath(identifier) == target:
+                systems.append(SharedSystemClient._identifier_to_system.pop(identifier))
+                SharedSystemClient._identifier_to_refcount.pop(identifier, None)
+    for system in systems:
+        try:
+            system.stop()
+        except Exception as e:
+            print(f"Error closing vector store {persist_directory}: {e}")
+
+
+def get_db_root():
+    db_root = Path(os.environ.get('ELECTRON_APP_DATA_DIR', '.')) / 'storage' / 'db_store'
+    os.makedirs(str(db_root), exist_ok=True)
+    return db_root
+
+
+def get_flat_index_path(vector_database_path):
+    return get_db_root() / f"{vector_database_path}{FLAT_INDEX_SUFFIX}"
+
+
+_flat_index_cache = OrderedDict()
+_flat_index_lock = threading.Lock()
+
+
+def _load_flat_index(path):
+    mtime = os.path.getmtime(path)
+    with _flat_index_lock:
+        cached = _flat_index_cache.get(path)
+        if cached is not None and cached[0] == mtime:
+            _flat_index_cache.move_to_end(path)
+            return cached[1]
+
+    index = FlatIndex.load(path)
+    with _flat_index_lock:
+        _flat_index_cache[path] = (mtime, index)
+        while len(_flat_index_cache) > FLAT_INDEX_CACHE_SIZE:
+            _flat_index_cache.popitem(last=False)
+    return index
+
+
+def forget_flat_index(path):
+    with _flat_index_lock:
+        _flat_index_cache.pop(str(path), None)
+
+
+def search_vectors(vector_database_path, query_embedding, k):
+    flat_path = str(get_flat_index_path(vector_database_path))
+    if os.path.exists(flat_path):
+        with span("rag.open_store"):
+            index = _load_flat_index(flat_path)
+        embedding_id = get_embedding_id()
+        if index.embedding_id != embedding_id:
+            raise EmbeddingMismatchError(
+                f"Vector store {vector_database_path} was built with {index.embedding_id} embeddings but the "
+                f"current backend is {embedding_id}. Re-upload the file or switch HERMA_EMBEDDING_BACKEND back."
+            )
+        with span("rag.search"):
+            return index.search(query_embedding, k)
+
+    with span("rag.open_store"):
+        db = open_chroma(get_db_root() / vector_database_path)
+    with span("rag.search"):
+        return db.similarity_search_by_vector_with_relevance_scores(query_embedding, k=k)
+
+
+class VectorStoreWriter:
+    # Collections start out as a flat index and are promoted to Chroma once they
+    # grow past max_flat_chunks, so small uploads and chat history never pay for a
+    # persist directory, SQLite and HNSW.
+    def __init__(self, vector_database_path, max_flat_chunks=None, resume=False):
+        self.vector_database_path = vector_database_path
+        if max_flat_chunks is None:
+            max_flat_chunks = int(os.environ.get('HERMA_FLAT_INDEX_MAX_CHUNKS', '1024'))
+        self.max_flat_chunks = max_flat_chunks
+        self.embedding_function = get_embedding_function()
+        self.embedding_id = get_embedding_id()
+        self.db = None
+        self.ids = []
+        self.texts = []
+        self.metadatas = []
+        self.embeddings = []
+        # A checkpointed ingestion picks up the Chroma store it was writing to.
+        if resume and (get_db_root() / vector_database_path).is_dir():
+            self._promote()
+
+    @property
+    def persisted(self):
+        # Only Chroma writes are durable; the flat index is written on close.
+        return self.db is not None
+
+    def add_missing(self, chunks):
+        if self.db is None:
+            self.add(chunks)
+            return 0
+        ids = [chunk.metadata["id"] for chunk in chunks]
+        stored = set(self.db._collection.get(ids=ids, include=[])["ids"])
+        missing = [chunk for chunk in chunks if chunk.metadata["id"] not in stored]
+        self.add(missing)
+        return len(chunks) - len(missing)
+
+    def add(self, chunks):
+        if not chunks:
+            return
+        self.add_embedded(chunks, self.embedding_function.embed_documents([chunk.page_content for chunk in chunks]))
+
+    def add_embedded(self, chunks, embeddings):
+        if not chunks:
+            return
+        ids = [chunk.metadata["id"] for chunk in chunks]
+        texts = [chunk.page_content for chunk in chunks]
+        metadatas = [chunk.metadata for chunk in chunks]
+
+        if self.db is None and len(self.ids) + len(ids) <= self.max_flat_chunks:
+            self.ids.extend(ids)
+            self.texts.extend(texts)
+            self.metadatas.extend(metadatas)
+            self.embeddings.extend(embeddings)
+            return
+
+        if self.db is None:
+            self._promote()
+        self.db._collection.upsert(ids=ids, embeddings=embeddings, documents=texts, metadatas=metadatas)
+
+    def clear(self):
+        # Drops everything written so far, for an ingestion that has to start over.
+        if self.db is not None:
+            ids = self.db._collection.get(include=[])["ids"]
+            for start in range(0, len(ids), 5000):
+                self.db._collection.delete(ids=ids[start:start + 5000])
+        self.ids, self.texts, self.metadatas, self.embeddings = [], [], [], []
+
+    def _promote(self):
+        db_path = get_db_root() / self.vector_database_path
+        os.makedirs(str(db_path), exist_ok=True)
+        self.db = open_chroma(db_path)
+        if self.ids:
+            self.db._collection.upsert(ids=self.ids, embeddings=self.embeddings, documents=self.texts,
+                                       metadatas=self.metadatas)
+        self.ids, self.texts, self.metadatas, self.embeddings = [], [], [], []
+
+    def close(self):
+        if self.db is None:
+            FlatIndex.write(str(get_flat_index_path(self.vector_database_path)), self.embedding_id, self.ids,
+                            self.texts, self.metadatas, self.embeddings,
+                            dtype=os.environ.get('HERMA_FLAT_INDEX_DTYPE', 'int8'))
@@ -0,0 +1,258 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from vector_store import open_chroma
+from uploaded_data import Uploaded_data, SUPPORTED_EXTENSIONS, EMBEDDING_BATCH_SIZE
+from storage_manager import get_storage_manager
+
+
+class WatchedFolder(Uploaded_data):
+    def __init__(self, name, folder_path, chunk_size, max_workers=4):
+        if not os.path.isdir(folder_path):
+            raise FileNotFoundError(f"Folder not found: {folder_path}")
+
+        self.non_chat_history = True
+        self.name = name
+        self.chunk_size = chunk_size
+        self.data_path = os.path.abspath(folder_path)
+        self.max_workers = max_workers
+        self.timestamp = int(time.time() * 1000)
+        self.vector_database_path = f"{name}_{self.timestamp}"
+        self.revision = 0
+        self._sync_lock = threading.Lock()
+
+        summary_chunks = []
+        self.sync(summary_chunks)
+        self.data_summary = self.generate_summary(summary_chunks)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("_sync_lock", None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._sync_lock = threading.Lock()
+        # The data store is only pickled on a clean exit; after a crash the state
+        # file has the newer revision.
+        self.revision = max(self.revision, self._read_state().get("revision", 0))
+
+    def get_state_path(self):
+        state_dir = self.get_project_root() / 'storage' / 'watched_folders'
+        os.makedirs(str(state_dir), exist_ok=True)
+        return state_dir / f"{self.vector_database_path}.json"
+
+    def _read_state(self):
+        try:
+            with open(self.get_state_path(), 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+        if "files" not in state:
+            # Written before the revision was stored alongside the files.
+            return {"files": state}
+        return state
+
+    def load_file_state(self):
+        return self._read_state().get("files", {})
+
+    def save_file_state(self, file_state):
+        state_path = self.get_state_path()
+        temp_file = f"{state_path}.tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump({"revision": self.revision, "files": file_state}, f)
+        os.replace(temp_file, state_path)
+
+    def remove_file_state(self):
+        state_path = self.get_state_path()
+        if os.path.exists(state_path):
+            os.remove(state_path)
+
+    def reindex(self):
+        self.remove_file_state()
+        self.sync(rebuild=True)
+
+    def scan(self):
+        files = {}
+        for root, dirs, filenames in os.walk(self.data_path):
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            for filename in filenames:
+                if filename.startswith(('.', '~$')) or not filename.lower().endswith(SUPPORTED_EXTENSIONS):
+                    continue
+                file_path = os.path.join(root, filename)
+                try:
+                    stat = os.stat(file_path)
+                except OSError:
+                    continue
+                files[file_path] = (stat.st_mtime_ns, stat.st_size)
+        return files
+
+    @staticmethod
+    def hash_file(file_path):
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _index_file(self, db, db_lock, file_path, previous):
+        # Streams one file into the store in embedding batches, so a multi-gigabyte
+        # export never has to be held in memory. Returns the file hash, whether it
+        # was "unchanged", "added" or "changed", and its first chunks.
+        file_hash = self.hash_file(file_path)
+        if previous is not None and previous["hash"] == file_hash:
+            return file_hash, "unchanged", []
+
+        existing_hashes = {}
+        if previous is not None:
+            with db_lock:
+                existing = db.get(where={"source": file_path}, include=["metadatas"])
+            existing_hashes = {
+                chunk_id: (metadata or {}).get("unit_hash")
+                for chunk_id, metadata in zip(existing["ids"], existing["metadatas"])
+            }
+
+        head_chunks = []
+        seen_ids = set()
+        batch = []
+        for chunk in self.extract_chunks(file_path):
+            if len(head_chunks) < 6:
+                head_chunks.append(chunk)
+            batch.append(chunk)
+            if len(batch) >= EMBEDDING_BATCH_SIZE:
+                self._write_changed_units(db, db_lock, batch, existing_hashes, seen_ids)
+                batch = []
+        if batch:
+            self._write_changed_units(db, db_lock, batch, existing_hashes, seen_ids)
+
+        stale_ids = [chunk_id for chunk_id in existing_hashes if chunk_id not in seen_ids]
+        if stale_ids:
+            with db_lock:
+                db.delete(ids=stale_ids)
+        return file_hash, "added" if previous is None else "changed", head_chunks
+
+    @staticmethod
+    def _write_changed_units(db, db_lock, batch, existing_hashes, seen_ids):
+        # Slides and sections carry a unit hash, so an edited deck only re-embeds
+        # the units that changed. Chunks without one are always replaced.
+        changed_chunks = []
+        for chunk in batch:
+            chunk_id = chunk.metadata["id"]
+            seen_ids.add(chunk_id)
+            unit_hash = chunk.metadata.get("unit_hash")
+            if unit_hash is not None and existing_hashes.get(chunk_id) == unit_hash:
+                continue
+            changed_chunks.append(chunk)
+        if changed_chunks:
+            with db_lock:
+                db.add_documents(changed_chunks, ids=[chunk.metadata["id"] for chunk in changed_chunks])
+
+    def sync(self, summary_chunks=None, rebuild=False):
+        # The store is in use for the whole sync, so a quota pass cannot delete it
+        # half way and leave a state file that claims the files are indexed.
+        storage = get_storage_manager()
+        with self._sync_lock:
+            with storage.collection_lock(self.vector_database_path):
+                # Evicted folders are rebuilt in full on their next query.
+                if storage.is_evicted(self.vector_database_path) and not rebuild:
+                    return {"added": 0, "changed": 0, "removed": 0}
+                storage.acquire(self.vector_database_path)
+            try:
+                return self._sync(summary_chunks)
+            finally:
+                storage.release(self.vector_database_path)
+
+    def _sync(self, summary_chunks):
+        file_state = self.load_file_state()
+        current_files = self.scan()
+
+        removed = [path for path in file_state if path not in current_files]
+        candidates = []
+        for file_path, (mtime, size) in current_files.items():
+            previous = file_state.get(file_path)
+            if previous is None or previous["mtime"] != mtime or previous["size"] != size:
+                candidates.append(file_path)
+
+        if not removed and not candidates:
+            return {"added": 0, "changed": 0, "removed": 0}
+
+        # Bump the revision before touching the store as well as after, so
+        # answers cached against the old contents are never reused, even if
+        # the process dies half way through.
+        self.revision += 1
+        self.save_file_state(file_state)
+
+        db = open_chroma(self.get_db_path())
+
+        for file_path in removed:
+            db.delete(where={"source": file_path})
+            del file_state[file_path]
+        if removed:
+            self.save_file_state(file_state)
+
+        added = 0
+        changed = 0
+        db_lock = threading.Lock()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                executor.submit(self._index_file, db, db_lock, path, file_state.get(path)): path
+                for path in candidates
+            }
+            for future in as_completed(futures):
+                file_path = futures[future]
+                mtime, size = current_files[file_path]
+                try:
+                    file_hash, status, head_chunks = future.result()
+                except Exception as e:
+                    print(f"Error indexing {file_path}: {e}")
+                    continue
+
+                # An unchanged file was touched but not modified; only its stat
+                # info is stale.
+                if status == "added":
+                    added += 1
+                elif status == "changed":
+                    changed += 1
+
+                if summary_chunks is not None and len(summary_chunks) < 6:
+                    summary_chunks.extend(head_chunks[:6 - len(summary_chunks)])
+
+                file_state[file_path] = {"mtime": mtime, "size": size, "hash": file_hash}
+                self.save_file_state(file_state)
+
+        self.revision += 1
+        self.save_file_state(file_state)
+        if added or changed or removed:
+            get_storage_manager().register(self.vector_database_path, self.name, self.data_path)
+        return {"added": added, "changed": changed, "removed": len(removed)}
+
+
+class FolderWatcher:
+    def __init__(self, uploaded_data_store, interval=30):
+        self.uploaded_data_store = uploaded_data_store
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            for data in list(self.uploaded_data_store.data):
+                if not isinstance(data, WatchedFolder) or not os.path.isdir(data.data_path):
+                    continue
+                try:
+                    result = data.sync()
+                    if any(result.values()):
+                        print(f"Re-indexed watched folder {data.name}: {result}")
+                except Exception as e:
+                    print(f"Error syncing watched folder {data.name}: {e}")
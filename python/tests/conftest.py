@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The backend modules live side by side in python/scripts and import each other
+# as top-level modules, the same way main.py runs them.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
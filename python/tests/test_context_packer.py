@@ -0,0 +1,66 @@
+from langchain_core.documents import Document
+from context_packer import pack_context, estimate_tokens, PIECE_OVERHEAD_TOKENS
+
+
+def make_result(index, text, similarity, page=0, document_name="report.pdf"):
+    doc = Document(page_content=text, metadata={
+        "id": f"storage/{document_name} Page: {page}:{index}",
+        "document_name": document_name,
+        "tokens": estimate_tokens(text)
+    })
+    # Stores return squared L2 distance between unit vectors.
+    return doc, 2.0 * (1.0 - similarity)
+
+
+def test_cutoff_drops_chunks_far_behind_the_best_hit():
+    results = [
+        make_result(0, "revenue grew in the third quarter", 0.9),
+        make_result(5, "headcount stayed flat", 0.7),
+        make_result(9, "the office moved", 0.6),
+    ]
+    pieces = pack_context(results, 1000, min_similarity=0.2, similarity_margin=0.25)
+    assert [piece.first_index for piece in pieces] == [0, 5]
+
+
+def test_cutoff_applies_min_similarity():
+    results = [make_result(0, "barely related", 0.3), make_result(4, "unrelated", 0.1)]
+    pieces = pack_context(results, 1000, min_similarity=0.2, similarity_margin=1.0)
+    assert [piece.first_index for piece in pieces] == [0]
+    assert pack_context([make_result(0, "unrelated", 0.1)], 1000, min_similarity=0.2) == []
+
+
+def test_budget_skips_large_chunk_but_takes_smaller_one_below():
+    large = " ".join(["word"] * 200)
+    small = "short answer"
+    results = [
+        make_result(0, "best match", 0.9),
+        make_result(3, large, 0.85),
+        make_result(7, small, 0.8),
+    ]
+    budget = 2 * PIECE_OVERHEAD_TOKENS + estimate_tokens("best match") + estimate_tokens(small)
+    pieces = pack_context(results, budget)
+    assert [piece.first_index for piece in pieces] == [0, 7]
+
+
+def test_neighbouring_chunks_are_merged_without_repeating_the_overlap():
+    first = "The budget for next year was approved by the board after a long review."
+    second = "after a long review. Spending on research rises by ten percent."
+    results = [
+        make_result(4, second, 0.8),
+        make_result(3, first, 0.9),
+        make_result(3, "another page", 0.85, page=1),
+    ]
+    pieces = pack_context(results, 1000)
+
+    merged = [piece for piece in pieces if piece.page == "0"]
+    assert len(merged) == 1
+    assert merged[0].text == first + " Spending on research rises by ten percent."
+    assert merged[0].section == "3-4"
+    assert merged[0].similarity == 0.9
+    assert len(pieces) == 2
+
+
+def test_non_adjacent_chunks_stay_separate():
+    results = [make_result(1, "first part", 0.9), make_result(3, "third part", 0.85)]
+    pieces = pack_context(results, 1000)
+    assert sorted(piece.section for piece in pieces) == ["1", "3"]
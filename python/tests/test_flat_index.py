@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from flat_index import FlatIndex
+
+
+def make_collection(count=40, dim=32, seed=7):
+    rng = np.random.default_rng(seed)
+    embeddings = rng.normal(size=(count, dim)).astype(np.float32)
+    ids = [f"doc.txt Page: 0:{i}" for i in range(count)]
+    texts = [f"chunk {i}" for i in range(count)]
+    metadatas = [{"id": chunk_id, "source": "doc.txt", "page": 0} for chunk_id in ids]
+    return ids, texts, metadatas, embeddings
+
+
+@pytest.mark.parametrize("dtype", ["int8", "float16"])
+def test_round_trip_keeps_search_order(tmp_path, dtype):
+    ids, texts, metadatas, embeddings = make_collection()
+    path = str(tmp_path / f"collection.{dtype}.hflat")
+    FlatIndex.write(path, "hash:32", ids, texts, metadatas, embeddings.tolist(), dtype=dtype)
+
+    index = FlatIndex.load(path)
+    assert len(index) == len(ids)
+    assert index.embedding_id == "hash:32"
+
+    query = embeddings[3] + 0.05 * embeddings[11]
+    results = index.search(query.tolist(), 5)
+
+    unit = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    expected = np.argsort(-(unit @ (query / np.linalg.norm(query))))[:5]
+    assert [doc.metadata["id"] for doc, _ in results] == [ids[i] for i in expected]
+    assert results[0][0].page_content == "chunk 3"
+
+    distances = [distance for _, distance in results]
+    assert distances == sorted(distances)
+    assert distances[0] == pytest.approx(2.0 - 2.0 * float(unit[3] @ (query / np.linalg.norm(query))), abs=0.02)
+
+
+def test_k_larger_than_collection(tmp_path):
+    ids, texts, metadatas, embeddings = make_collection(count=3)
+    path = str(tmp_path / "small.hflat")
+    FlatIndex.write(path, "hash:32", ids, texts, metadatas, embeddings.tolist())
+
+    assert len(FlatIndex.load(path).search(embeddings[0].tolist(), 10)) == 3
+
+
+@pytest.mark.parametrize("dtype", ["int8", "float16"])
+def test_empty_collection(tmp_path, dtype):
+    path = str(tmp_path / "empty.hflat")
+    FlatIndex.write(path, "hash:32", [], [], [], [], dtype=dtype)
+
+    index = FlatIndex.load(path)
+    assert len(index) == 0
+    assert index.search([1.0, 0.0], 3) == []
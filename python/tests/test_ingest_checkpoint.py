@@ -0,0 +1,66 @@
+import threading
+import types
+from ingest_checkpoint import IngestCheckpoint, is_file_claimed
+
+
+def open_checkpoint(tmp_path, monkeypatch):
+    monkeypatch.setenv("ELECTRON_APP_DATA_DIR", str(tmp_path))
+    data_path = tmp_path / "report.txt"
+    data_path.write_text("quarterly report\n" * 100)
+    upload = types.SimpleNamespace(name="report.txt", data_path=str(data_path), chunk_size=500,
+                                   vector_database_path="report.txt_1", timestamp=1)
+    checkpoint = IngestCheckpoint.open(upload, "hash:32")
+    checkpoint.commit(64, "report.txt Page: 0:63")
+    return upload, checkpoint
+
+
+def is_claimed_elsewhere(data_path):
+    results = []
+    checker = threading.Thread(target=lambda: results.append(is_file_claimed(data_path)))
+    checker.start()
+    checker.join(5)
+    return results[0]
+
+
+def test_find_claims_the_checkpoint_for_the_calling_thread(tmp_path, monkeypatch):
+    upload, checkpoint = open_checkpoint(tmp_path, monkeypatch)
+    checkpoint.release()
+
+    found, in_flight = IngestCheckpoint.find(upload.data_path, 500, "hash:32")
+    try:
+        assert in_flight is None
+        assert found.vector_database_path == "report.txt_1"
+        assert found.chunks_committed == 64
+        # The same upload goes on to open it without tripping over its own claim.
+        opened = IngestCheckpoint.open(upload, "hash:32")
+        assert opened.chunks_committed == 64
+        opened.release()
+        assert is_claimed_elsewhere(upload.data_path)
+    finally:
+        found.release()
+    assert not is_claimed_elsewhere(upload.data_path)
+
+
+def test_find_reports_a_resume_in_flight_without_waiting(tmp_path, monkeypatch):
+    upload, checkpoint = open_checkpoint(tmp_path, monkeypatch)
+    results = []
+    finder = threading.Thread(target=lambda: results.append(IngestCheckpoint.find(upload.data_path, 500, "hash:32")))
+    finder.start()
+    finder.join(5)
+    found, in_flight = results[0]
+    assert found is None
+    assert in_flight.vector_database_path == "report.txt_1"
+    assert is_claimed_elsewhere(upload.data_path)
+    # The thread holding the claim is free to read its own file.
+    assert not is_file_claimed(upload.data_path)
+
+    # A re-upload attaches to the resume and picks up once it lets go.
+    waiter = threading.Thread(target=in_flight.wait_released)
+    waiter.start()
+    waiter.join(0.3)
+    assert waiter.is_alive()
+    checkpoint.release()
+    waiter.join(5)
+    assert not waiter.is_alive()
+    assert not is_claimed_elsewhere(upload.data_path)
+
@@ -0,0 +1,49 @@
+import sys
+import time
+import subprocess
+from ingest_workers import IngestionPool
+
+
+class FakeWorker:
+    def __init__(self, busy):
+        # Any process will do: an interpreter is well over 1 MB resident.
+        self.process = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+        self.busy = busy
+        self.memory_exceeded = False
+
+
+def test_busy_worker_over_the_memory_limit_is_killed(tmp_path):
+    pool = IngestionPool(tmp_path / "batches", max_workers=1, memory_limit_mb=1)
+    worker = FakeWorker(busy=True)
+    process = worker.process
+    with pool._lock:
+        pool._workers.add(worker)
+    try:
+        deadline = time.monotonic() + 10
+        while process.poll() is None and time.monotonic() < deadline:
+            time.sleep(0.1)
+        assert process.poll() is not None
+        assert worker.memory_exceeded
+        assert pool.peak_worker_rss > 1024 * 1024
+    finally:
+        with pool._lock:
+            pool._workers.discard(worker)
+        process.kill()
+        pool.shutdown()
+
+
+def test_idle_workers_are_not_sampled(tmp_path):
+    pool = IngestionPool(tmp_path / "batches", max_workers=1, memory_limit_mb=1)
+    worker = FakeWorker(busy=False)
+    process = worker.process
+    with pool._lock:
+        pool._workers.add(worker)
+    try:
+        time.sleep(1.5)
+        assert process.poll() is None
+        assert pool.peak_worker_rss == 0
+    finally:
+        with pool._lock:
+            pool._workers.discard(worker)
+        process.kill()
+        pool.shutdown()
@@ -0,0 +1,64 @@
+import os
+import time
+import pytest
+from langchain_core.documents import Document
+from storage_manager import StorageManager
+from vector_store import VectorStoreWriter, search_vectors, get_db_root
+from get_embedding_function import get_embedding_function
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    monkeypatch.setenv("ELECTRON_APP_DATA_DIR", str(tmp_path))
+    monkeypatch.setenv("HERMA_EMBEDDING_BACKEND", "hash")
+    return StorageManager(get_db_root(), str(tmp_path / "index.json"), orphan_grace=0)
+
+
+def write_chroma_store(collection, count=6):
+    # Small max_flat_chunks forces a Chroma persist directory.
+    writer = VectorStoreWriter(collection, max_flat_chunks=2)
+    writer.add([Document(page_content=f"chunk number {i}", metadata={"id": f"notes.txt Page: 0:{i}"})
+                for i in range(count)])
+    writer.close()
+
+
+def test_evicted_chroma_store_can_be_rebuilt_at_the_same_path(storage, tmp_path):
+    data_path = tmp_path / "notes.txt"
+    data_path.write_text("notes")
+    write_chroma_store("notes.txt_1")
+    storage.register("notes.txt_1", "notes.txt", str(data_path))
+    assert search_vectors("notes.txt_1", get_embedding_function().embed_query("chunk number 2"), 1)
+
+    assert storage.evict("notes.txt_1")
+    assert storage.is_evicted("notes.txt_1")
+    assert not (get_db_root() / "notes.txt_1").exists()
+
+    write_chroma_store("notes.txt_1")
+    storage.register("notes.txt_1", "notes.txt", str(data_path))
+    results = search_vectors("notes.txt_1", get_embedding_function().embed_query("chunk number 2"), 1)
+    assert results[0][0].metadata["id"] == "notes.txt Page: 0:2"
+    assert not storage.is_evicted("notes.txt_1")
+
+
+def test_collections_in_use_are_not_evicted(storage, tmp_path):
+    data_path = tmp_path / "notes.txt"
+    data_path.write_text("notes")
+    write_chroma_store("notes.txt_1")
+    storage.register("notes.txt_1", "notes.txt", str(data_path))
+
+    with storage.using("notes.txt_1"):
+        assert not storage.evict("notes.txt_1")
+    assert (get_db_root() / "notes.txt_1").exists()
+    assert storage.evict("notes.txt_1")
+
+
+def test_garbage_collection_skips_unregistered_stores_in_use(storage):
+    with storage.using("folder_1"):
+        write_chroma_store("folder_1")
+        old = time.time() - 10
+        os.utime(str(get_db_root() / "folder_1"), (old, old))
+        assert storage.collect_garbage(referenced=set()) == 0
+        assert (get_db_root() / "folder_1").exists()
+
+    assert storage.collect_garbage(referenced=set()) == 1
+    assert not (get_db_root() / "folder_1").exists()
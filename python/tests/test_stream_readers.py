@@ -0,0 +1,71 @@
+import json
+import codecs
+from stream_readers import detect_encoding, iter_csv_row_groups, iter_json_records
+import stream_readers
+
+
+def write_bytes(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_json_array_is_streamed_per_element(tmp_path, monkeypatch):
+    # A tiny read size makes elements straddle buffer refills.
+    monkeypatch.setattr(stream_readers, "JSON_READ_SIZE", 7)
+    records = [{"id": i, "text": "x" * i, "value": 1.5 * i} for i in range(30)]
+    path = write_bytes(tmp_path, "array.json", json.dumps(records).encode("utf-8"))
+
+    result = list(iter_json_records(path))
+
+    assert [key for key, _ in result] == [f"[{i}]" for i in range(30)]
+    assert [record for _, record in result] == records
+
+
+def test_json_object_streams_nested_arrays_and_keeps_other_members(tmp_path):
+    document = {"meta": {"version": 2}, "items": [{"a": 1}, {"a": 2}], "empty": [], "count": 12}
+    path = write_bytes(tmp_path, "object.json", json.dumps(document, indent=2).encode("utf-8"))
+
+    result = list(iter_json_records(path))
+
+    assert result == [("meta", {"version": 2}), ("items[0]", {"a": 1}), ("items[1]", {"a": 2}), ("count", 12)]
+
+
+def test_json_lines(tmp_path):
+    lines = [{"n": 1}, {"n": 2}, {"n": 3}]
+    data = "\n".join(json.dumps(line) for line in lines[:2]) + "\n\n" + json.dumps(lines[2]) + "\n"
+    path = write_bytes(tmp_path, "records.jsonl", data.encode("utf-8"))
+
+    result = list(iter_json_records(path))
+
+    assert result == [("line 1", {"n": 1}), ("line 2", {"n": 2}), ("line 4", {"n": 3})]
+
+
+def test_json_with_utf8_bom(tmp_path):
+    path = write_bytes(tmp_path, "bom.json", codecs.BOM_UTF8 + json.dumps([{"name": "café"}]).encode("utf-8"))
+
+    assert detect_encoding(path) == "utf-8-sig"
+    assert list(iter_json_records(path)) == [("[0]", {"name": "café"})]
+
+
+def test_cp1252_csv_is_detected_and_grouped(tmp_path):
+    rows = ["name;city"] + [f"Renée {i};Köln" for i in range(5)]
+    text = "\r\n".join(rows) + "\r\n"
+    # Enough accented text for a confident guess.
+    text += "\r\n".join(f"Françoise {i};München été" for i in range(40)) + "\r\n"
+    path = write_bytes(tmp_path, "legacy.csv", text.encode("cp1252"))
+
+    assert detect_encoding(path) != "utf-8"
+    groups = list(iter_csv_row_groups(path, 20))
+
+    header, first_rows, first_start, first_end = groups[0]
+    assert header == ["name", "city"]
+    assert first_rows[0] == ["Renée 0", "Köln"]
+    assert (first_start, first_end) == (2, 21)
+    assert [len(group[1]) for group in groups] == [20, 20, 5]
+
+
+def test_header_only_csv_yields_empty_group(tmp_path):
+    path = write_bytes(tmp_path, "header.csv", b"a,b,c\n")
+
+    assert list(iter_csv_row_groups(path, 50)) == [(["a", "b", "c"], [], 1, 1)]